@@ -0,0 +1,362 @@
+"""Benchmarks of the bot monitor's hot paths against the in-memory database
+
+Each scenario runs in a fresh process on an InMemoryBackend filled with
+generated games, and reports throughput, latency percentiles, peak RSS and the
+peak number of threads:
+
+- discovery: find_available_games, by scanning all games or from a LobbyIndex
+- update_players: GameManager.update_players on every game, as done for each players event
+- night_actions: scheduling and running every bot's night action (simulated time,
+  writes batched per game)
+- listener: games/.../players writes at a fixed rate, from the write until the
+  GameManager has handled the event, with one listener pair per game or --multiplex
+
+Results are saved as JSON; pass an earlier file as --baseline to diff against it.
+
+Usage:
+    python benchmark_monitor.py --out bench.json
+    python benchmark_monitor.py --quick --out new.json --baseline bench.json
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+import palermo_bots as mp
+
+BOT_ROLES = [mp.Role.MAFIOSO, mp.Role.SGARRISTA, mp.Role.ISPETTORE, mp.Role.IL_PRETE, mp.Role.PAESANO]
+
+# Scenario parameters swept by default, and with --quick
+SWEEPS = {
+    'games': ([10, 100, 1000, 10000], [10, 100, 1000]),
+    'bots': ([4, 12, 50], [4, 12]),
+    'rates': ([100, 1000, 5000], [100, 1000]),
+}
+
+def make_game(game_id, bots, status=mp.GameState.LOBBY, phase=0):
+    """A game with a host and bots guest_{game_id}_{n}, with roles unless in the lobby"""
+    players = {'host': {'id': 'host', 'name': 'Host', 'isAlive': True, 'role': mp.Role.PAESANO}}
+    for n in range(bots):
+        player_id = f'guest_{game_id}_{n}'
+        players[player_id] = {
+            'id': player_id,
+            'name': f'Bot {n}',
+            'isAlive': True,
+            'role': BOT_ROLES[n % len(BOT_ROLES)] if status != mp.GameState.LOBBY else None
+        }
+    return {
+        'hostId': 'host',
+        'gameCode': game_id[-4:],
+        'status': status,
+        'currentPhase': phase,
+        'virtualPlayersEnabled': True,
+        'players': players
+    }
+
+def populate(games, bots, status=mp.GameState.LOBBY, phase=0):
+    """Fill the current backend with games g00000.. and return their IDs"""
+    game_ids = [f'g{i:05d}' for i in range(games)]
+    mp.reference('games').set({game_id: make_game(game_id, bots, status, phase) for game_id in game_ids})
+    return game_ids
+
+def make_manager(game_id, bots, **options):
+    """A GameManager owning the bots of a populated game, with its mirror loaded and their roles set"""
+    manager = mp.GameManager(game_id, **options)
+    manager.mirror.apply('put', '/', mp.reference(f'games/{game_id}').get())
+    manager.game_state = manager.mirror.get('status')
+    manager.current_phase = manager.mirror.get('currentPhase', 0)
+    for n in range(bots):
+        manager.add_virtual_player(f'guest_{game_id}_{n}', f'Bot {n}', created_by_us=True)
+    # Roles and liveness from the mirror, as after the state change that starts a phase
+    manager.update_players()
+    return manager
+
+def repeat(func, min_seconds=1.0, min_calls=3):
+    """Call func until min_seconds and min_calls are both reached, returns the call durations"""
+    durations = []
+    started = time.perf_counter()
+    while len(durations) < min_calls or time.perf_counter() - started < min_seconds:
+        call_started = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - call_started)
+    return durations
+
+def bench_discovery(games, index=False, **_):
+    mp.set_backend(mp.InMemoryBackend())
+    populate(games, 2)
+    lobby_index = None
+    if index:
+        lobby_index = mp.LobbyIndex()
+        lobby_index.start()
+        lobby_index.loaded.wait(60)
+    durations = repeat(lambda: mp.find_available_games(lobby_index))
+    if lobby_index:
+        lobby_index.stop()
+    return {'ops': len(durations), 'seconds': sum(durations), 'unit': 'scans/s', 'latency': durations}
+
+def bench_update_players(games, bots, **_):
+    mp.set_backend(mp.InMemoryBackend())
+    game_ids = populate(games, bots, mp.GameState.NIGHT, 1)
+    managers = [make_manager(game_id, bots) for game_id in game_ids]
+    durations = []
+    for manager in itertools.islice(itertools.cycle(managers), max(len(managers), 2000)):
+        started = time.perf_counter()
+        manager.update_players()
+        durations.append(time.perf_counter() - started)
+    return {'ops': len(durations), 'seconds': sum(durations), 'unit': 'calls/s', 'latency': durations}
+
+def bench_night_actions(games, bots, **_):
+    mp.set_clock(mp.VirtualClock())
+    scheduler = mp.SimulatedScheduler(mp.clock)
+    mp.set_backend(mp.InMemoryBackend(scheduler=scheduler))
+    batcher = mp.WriteBatcher(scheduler=scheduler)
+    game_ids = populate(games, bots, mp.GameState.NIGHT, 1)
+    managers = [make_manager(game_id, bots, batcher=batcher, scheduler=scheduler) for game_id in game_ids]
+    durations = []
+    performed = []
+
+    def timed(player, phase, roster):
+        started = time.perf_counter()
+        if mp.VirtualPlayer.perform_night_action(player, phase, roster):
+            performed.append(player.player_id)
+        durations.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for manager in managers:
+        manager.schedule_bot_actions(timed)
+    scheduler.run()
+    batcher.close()
+    elapsed = time.perf_counter() - started
+
+    # Only report numbers for actions that really reached the database
+    written = sum(len(mp.reference(f'games/{game_id}/actions/night/1').get() or {}) for game_id in game_ids)
+    if not performed or written != len(performed):
+        raise RuntimeError(f"night_actions: {len(performed)} actions performed but {written} written under actions/night/1")
+    return {'ops': len(durations), 'seconds': elapsed, 'unit': 'actions/s', 'latency': durations}
+
+def bench_listener(games, bots, rate, duration=3.0, multiplex=False, **_):
+    mp.set_backend(mp.InMemoryBackend())
+    game_ids = populate(games, bots, mp.GameState.DAY_DISCUSSION, 1)
+    dispatcher = mp.GameEventDispatcher() if multiplex else None
+    if dispatcher:
+        dispatcher.start()
+    durations = []
+    lock = threading.Lock()
+    managers = []
+
+    for game_id in game_ids:
+        manager = make_manager(game_id, bots)
+        handle = manager.on_game_change
+
+        def timed(event, handle=handle):
+            handle(event)
+            # Our writes are puts of perf_counter() at players/{id}/ping
+            if event.path.endswith('/ping') and isinstance(event.data, float):
+                with lock:
+                    durations.append(time.perf_counter() - event.data)
+
+        manager.on_game_change = timed
+        manager.start_monitoring(dispatcher)
+        managers.append(manager)
+
+    players = [f'games/{game_id}/players/guest_{game_id}_0/ping' for game_id in game_ids]
+    sent = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        ahead = started + sent / rate - time.perf_counter()
+        if ahead > 0:
+            time.sleep(ahead)
+        mp.reference(players[sent % len(players)]).set(time.perf_counter())
+        sent += 1
+
+    # Let the listeners catch up, up to a second
+    deadline = time.perf_counter() + 1.0
+    while len(durations) < sent and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - started
+
+    for manager in managers:
+        manager.stop_monitoring(immediate=True)
+    if dispatcher:
+        dispatcher.stop()
+    return {'ops': len(durations), 'seconds': elapsed, 'unit': 'events/s', 'latency': durations,
+            'sent': sent, 'lost': sent - len(durations)}
+
+SCENARIOS = {
+    'discovery': bench_discovery,
+    'update_players': bench_update_players,
+    'night_actions': bench_night_actions,
+    'listener': bench_listener,
+}
+
+def scenario_grid(names, games, bots, rates, duration):
+    """The (name, params) of every scenario to run"""
+    grid = []
+    for name in names:
+        if name == 'discovery':
+            grid += [(name, {'games': g, 'index': index}) for index in (False, True) for g in games]
+        elif name in ('update_players', 'night_actions'):
+            grid += [(name, {'games': g, 'bots': b}) for b in bots for g in games]
+        elif name == 'listener':
+            # Without --multiplex each game has two listener threads: stop at 1000 games
+            grid += [(name, {'games': g, 'bots': bots[0], 'rate': r, 'duration': duration, 'multiplex': multiplex})
+                     for multiplex in (False, True) for r in rates for g in games
+                     if multiplex or g <= 1000]
+    return grid
+
+def scenario_key(name, params):
+    return name + ''.join(f' {key}={params[key]}' for key in sorted(params) if key != 'duration')
+
+class PeakThreads:
+    """Samples the number of threads in the background and keeps the highest"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self.running = True
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+
+    def _sample(self):
+        while self.running:
+            # Not counting this thread
+            self.peak = max(self.peak, threading.active_count() - 1)
+            time.sleep(self.interval)
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        return self.peak
+
+def run_scenario(name, params):
+    """Run one scenario in this process and return its result"""
+    mp.seed_random(1)
+    threads = PeakThreads()
+    # The monitor prints every step; that's not what we're measuring
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        result = SCENARIOS[name](**params)
+    durations = sorted(result.pop('latency'))
+
+    result.update({
+        'name': name,
+        'params': params,
+        'throughput': result['ops'] / result['seconds'] if result['seconds'] else 0.0,
+        'latency_ms': {
+            f'p{p}': 1000 * mp.LatencyStats.percentile(durations, p) for p in (50, 95, 99)
+        } if durations else {},
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        'peak_threads': threads.stop()
+    })
+    if durations:
+        result['latency_ms']['max'] = 1000 * durations[-1]
+    return result
+
+def run_isolated(name, params, timeout):
+    """Run one scenario in a fresh process, so its peak RSS and threads are its own"""
+    command = [sys.executable, os.path.abspath(__file__), '--run-scenario', json.dumps([name, params])]
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, timeout=timeout, check=True).stdout
+        return json.loads(output.strip().splitlines()[-1])
+    except subprocess.TimeoutExpired:
+        return {'name': name, 'params': params, 'error': f'timed out after {timeout}s'}
+    except (subprocess.CalledProcessError, ValueError, IndexError) as e:
+        stderr = getattr(e, 'stderr', '') or ''
+        return {'name': name, 'params': params, 'error': stderr.strip().splitlines()[-1] if stderr.strip() else str(e)}
+
+def format_result(result):
+    label = scenario_key(result['name'], result['params'])
+    if 'error' in result:
+        return f"{label:<58}  ERROR: {result['error']}"
+    latency = result['latency_ms']
+    return (f"{label:<58}  {result['throughput']:>11,.0f} {result['unit']:<10}  "
+            f"p50={latency.get('p50', 0):>8.3f}ms  p95={latency.get('p95', 0):>8.3f}ms  "
+            f"rss={result['peak_rss_mb']:>7.1f}MB  threads={result['peak_threads']}")
+
+def compare(results, baseline, tolerance):
+    """Print the change of each scenario against a baseline, returns the regressions"""
+    previous = {scenario_key(r['name'], r['params']): r for r in baseline.get('results', []) if 'error' not in r}
+    regressions = []
+    print(f"\nCompared to the baseline of {baseline.get('created', '?')} (tolerance {tolerance:.0%}):")
+    for result in results:
+        key = scenario_key(result['name'], result['params'])
+        old = previous.get(key)
+        if old is None or 'error' in result:
+            continue
+        changes = {
+            'throughput': (result['throughput'] - old['throughput']) / old['throughput'] if old['throughput'] else 0.0,
+            'p95': ((result['latency_ms'].get('p95', 0) - old['latency_ms'].get('p95', 0)) / old['latency_ms']['p95']
+                    if old['latency_ms'].get('p95') else 0.0),
+            'rss': (result['peak_rss_mb'] - old['peak_rss_mb']) / old['peak_rss_mb'] if old['peak_rss_mb'] else 0.0,
+        }
+        worse = changes['throughput'] < -tolerance or changes['p95'] > tolerance or changes['rss'] > tolerance
+        if worse:
+            regressions.append(key)
+        print(f"{'!!' if worse else '  '} {key:<58}  throughput {changes['throughput']:+7.1%}  "
+              f"p95 {changes['p95']:+7.1%}  rss {changes['rss']:+7.1%}")
+    return regressions
+
+def parse_list(text):
+    return [int(value) for value in text.split(',')]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the bot monitor against the in-memory database')
+    parser.add_argument('--scenarios', type=str, default=','.join(SCENARIOS),
+                        help=f"Comma-separated scenarios to run (default: {','.join(SCENARIOS)})")
+    parser.add_argument('--games', type=parse_list, default=None, help='Game counts to sweep, e.g. 10,100,1000,10000')
+    parser.add_argument('--bots', type=parse_list, default=None, help='Bots per game to sweep, e.g. 4,12,50')
+    parser.add_argument('--rates', type=parse_list, default=None, help='Listener events per second to sweep, e.g. 100,1000,5000')
+    parser.add_argument('--duration', type=float, default=3.0, help='Seconds each listener scenario writes for (default: 3)')
+    parser.add_argument('--quick', action='store_true', help='Sweep fewer and smaller scenarios')
+    parser.add_argument('--timeout', type=float, default=600.0, help='Seconds after which a scenario is given up (default: 600)')
+    parser.add_argument('--out', type=str, default=None, help='Write the results to this JSON file')
+    parser.add_argument('--baseline', type=str, default=None, help='Results JSON of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Relative change counted as a regression (default: 0.1)')
+    parser.add_argument('--run-scenario', type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        name, params = json.loads(args.run_scenario)
+        print(json.dumps(run_scenario(name, params)))
+        sys.exit(0)
+
+    sweep = 1 if args.quick else 0
+    grid = scenario_grid(
+        [name for name in args.scenarios.split(',') if name],
+        args.games or SWEEPS['games'][sweep],
+        args.bots or SWEEPS['bots'][sweep],
+        args.rates or SWEEPS['rates'][sweep],
+        args.duration
+    )
+
+    results = []
+    for name, params in grid:
+        result = run_isolated(name, params, args.timeout)
+        results.append(result)
+        print(format_result(result), flush=True)
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'results': results
+    }
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} scenarios regressed")
+            sys.exit(1)
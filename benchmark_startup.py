@@ -0,0 +1,126 @@
+"""Startup time of the bot package, from a cold interpreter to the first lobby scan
+
+Every measurement runs in a fresh interpreter, a few times, and reports the
+median wall time of the whole process, the time from the first palermo_bots
+import to the end of the step, how many modules were loaded and which of the
+heavy ones (asyncio, http.server, firebase_admin, ...) were pulled in.
+
+Usage:
+    python benchmark_startup.py
+    python benchmark_startup.py --games 10000 --out startup.json
+    python benchmark_startup.py --firebase   # also scan the real database (needs credentials)
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HEAVY_MODULES = ['asyncio', 'http.server', 'sqlite3', 'msgpack', 'firebase_admin', 'google.auth', 'requests']
+
+# Code run in the child after its clock starts; STEPS[name] is what gets timed
+PROLOGUE = """
+import json, sys, time
+data = json.load(open(sys.argv[1])) if sys.argv[1] else None
+started = time.perf_counter()
+"""
+
+STEPS = {
+    'interpreter': "pass",
+    'import package': "import palermo_bots",
+    'import mutliplayer shim': "import mutliplayer",
+    'import GameManager': "from palermo_bots import GameManager",
+    'import cli': "import palermo_bots.cli",
+    'first lobby scan (memory)': (
+        "from palermo_bots import set_backend, InMemoryBackend, find_available_games\n"
+        "set_backend(InMemoryBackend(data))\n"
+        "find_available_games()"
+    ),
+    'first lobby scan (firebase)': (
+        "from palermo_bots import set_backend, FirebaseBackend, find_available_games\n"
+        "set_backend(FirebaseBackend(sys.argv[2], sys.argv[3]))\n"
+        "find_available_games()"
+    ),
+}
+
+EPILOGUE = """
+elapsed = time.perf_counter() - started
+print(json.dumps({
+    'step_ms': elapsed * 1000,
+    'modules': len(sys.modules),
+    'heavy': [name for name in %r if name in sys.modules]
+}))
+""" % (HEAVY_MODULES,)
+
+def lobby_data(games):
+    """Games for the in-memory scan: half open lobbies, half games in progress"""
+    return {'games': {
+        f'g{i:05d}': {
+            'hostId': 'host',
+            'status': 'lobby' if i % 2 else 'night',
+            'virtualPlayersEnabled': True,
+            'players': {'host': {'id': 'host', 'name': 'Host', 'isAlive': True}}
+        } for i in range(games)
+    }}
+
+def measure(step, data_path, extra_args, repeat):
+    """Run a step in repeat fresh interpreters, returns the median of each measurement"""
+    code = PROLOGUE + STEPS[step] + EPILOGUE
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', code, data_path or ''] + extra_args, capture_output=True,
+                                text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        wall = time.perf_counter() - started
+        result = json.loads(output.strip().splitlines()[-1])
+        result['wall_ms'] = wall * 1000
+        runs.append(result)
+    return {
+        'step': step,
+        'wall_ms': statistics.median(run['wall_ms'] for run in runs),
+        'step_ms': statistics.median(run['step_ms'] for run in runs),
+        'modules': runs[-1]['modules'],
+        'heavy': runs[-1]['heavy'],
+        'runs': repeat
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure cold start of the bot package up to the first lobby scan')
+    parser.add_argument('--repeat', type=int, default=5, help='Fresh interpreters per measurement (default: 5)')
+    parser.add_argument('--games', type=int, default=1000, help='Games in the in-memory database scanned (default: 1000)')
+    parser.add_argument('--firebase', action='store_true', help='Also measure the first scan of the real database')
+    parser.add_argument('--service-account', type=str, default='serviceAccountKey.json', help='Service account key for --firebase')
+    parser.add_argument('--database-url', type=str, default=None, help='Database URL for --firebase (default: the package\'s)')
+    parser.add_argument('--out', type=str, default=None, help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump(lobby_data(args.games), f)
+        data_path = f.name
+
+    steps = [step for step in STEPS if step != 'first lobby scan (firebase)']
+    firebase_args = []
+    if args.firebase:
+        from palermo_bots.constants import DATABASE_URL
+        steps.append('first lobby scan (firebase)')
+        firebase_args = [args.service_account, args.database_url or DATABASE_URL]
+
+    print(f"{'Step':<28}  {'Process':>9}  {'Step':>9}  {'Modules':>7}  Heavy modules loaded")
+    results = []
+    try:
+        for step in steps:
+            result = measure(step, data_path, firebase_args if 'firebase' in step else [], args.repeat)
+            results.append(result)
+            print(f"{step:<28}  {result['wall_ms']:>7.1f}ms  {result['step_ms']:>7.1f}ms  {result['modules']:>7}  "
+                  f"{', '.join(result['heavy']) or '-'}")
+    finally:
+        os.unlink(data_path)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'games': args.games, 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.out}")
@@ -0,0 +1,90 @@
+"""Virtual players for Palermo Justice games
+
+Bots join lobbies that have virtualPlayersEnabled set and play the night and
+day phases like real players. The package is split by concern (backends,
+bots, managers, scheduling, ...) and imports nothing up front: a name such as
+palermo_bots.GameManager loads its module on first access, and the database
+client is only created when the first reference() is made. Run the monitor
+with the palermo-bots command or python -m palermo_bots.
+"""
+
+import importlib
+
+# Module of every public name
+_EXPORTS = {
+    'constants': [
+        'SERVICE_ACCOUNT_PATH', 'DATABASE_URL', 'GameState', 'Role', 'ActionType', 'Team',
+        'ROLE_DISPLAY_NAMES', 'NIGHT_ACTIONS', 'MIN_PLAYERS', 'ROLE_DISTRIBUTION', 'SELF_PROTECT_CHANCE',
+    ],
+    'clocks': [
+        'RealClock', 'VirtualClock', 'SwitchableClock', 'clock', 'rng', 'set_clock', 'seed_random',
+    ],
+    'instrumentation': [
+        'MetricsRegistry', 'metrics', 'MetricsServer', 'MetricsDumper', 'InstrumentedReference',
+        'InstrumentedQuery', 'InstrumentedListener',
+    ],
+    'backends': [
+        'GameEvent', 'DatabaseBackend', 'FirebaseBackend', 'InMemoryBackend', 'InMemoryReference',
+        'InMemoryQuery', 'InMemoryListener', 'set_backend', 'get_backend', 'reference', 'ReadCache',
+        'set_read_cache', 'cached_get',
+    ],
+    'gateway': [
+        'TokenBucket', 'CallGateway', 'GatewayBackend', 'GatewayReference', 'GatewayQuery',
+    ],
+    'lobby': [
+        'generate_guest_id', 'generate_player_name', 'assign_roles', 'LobbyIndex', 'find_available_games',
+        'check_virtual_players_enabled',
+    ],
+    'batching': [
+        'WriteBatcher',
+    ],
+    'bots': [
+        'RosterSnapshot', 'ActionLog', 'set_action_log', 'intern_role', 'VirtualPlayer',
+    ],
+    'journal': [
+        'OwnershipJournal',
+    ],
+    'scheduling': [
+        'PhaseTiming', 'ScheduledCall', 'BotScheduler', 'SimulatedScheduler', 'default_scheduler',
+    ],
+    'mirror': [
+        'GameMirror', 'GameEventDispatcher',
+    ],
+    'resolution': [
+        'PhaseResolver', 'LiveTally',
+    ],
+    'manager': [
+        'set_ownership_journal', 'GameManager', 'GameRegistry', 'process_single_game', 'add_virtual_players',
+        'fill_game_room_with_guests', 'resume_journaled_games',
+    ],
+    'sharding': [
+        'HashRing', 'LeaseHeldError', 'ShardCoordinator',
+    ],
+    'recording': [
+        'SessionRecorder', 'RecordingBackend', 'RecordingReference', 'read_recording', 'SessionReplayer',
+        'run_replay',
+    ],
+    'janitor': [
+        'Janitor',
+    ],
+    'loadgen': [
+        'LatencyStats', 'ScriptedHost', 'run_load_generator',
+    ],
+    'cli': [
+        'main',
+    ],
+}
+_MODULES = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = sorted(_MODULES)
+
+def __getattr__(name):
+    module = _MODULES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{module}', __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return __all__
@@ -0,0 +1,5 @@
+"""python -m palermo_bots"""
+
+from .cli import main
+
+main()
@@ -0,0 +1,527 @@
+"""Database backends: Firebase through firebase_admin, or an in-process stand-in"""
+
+import threading
+import copy
+import hashlib
+import json
+import queue
+import collections
+
+from .constants import DATABASE_URL, SERVICE_ACCOUNT_PATH
+from .clocks import clock, rng
+from .instrumentation import InstrumentedReference, metrics
+
+class GameEvent:
+    """A put/patch event with the same attributes as firebase_admin's db.Event"""
+    
+    def __init__(self, event_type, path, data):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+class DatabaseBackend:
+    """The database the monitor talks to
+    
+    reference(path) returns an object with the part of firebase_admin's
+    db.Reference API used here: key, path, child(), get() (with etag/shallow),
+    get_if_changed(), set(), set_if_unchanged(), update(), delete(), push(),
+    listen(), transaction() and order_by_child/order_by_key/order_by_value queries.
+    """
+    
+    def reference(self, path='/'):
+        raise NotImplementedError
+
+class FirebaseBackend(DatabaseBackend):
+    """The Firebase Realtime Database, through firebase_admin"""
+    
+    def __init__(self, service_account_path=SERVICE_ACCOUNT_PATH, database_url=DATABASE_URL, pool_size=None,
+                 pool_hosts=None):
+        """Initialize the Firebase app (once per process)
+        
+        Args:
+            service_account_path: Path to the service account key
+            database_url: URL of the Realtime Database
+            pool_size: Keep-alive connections kept per host, shared by every thread (default: requests' 10)
+            pool_hosts: Hosts (database shards) a connection pool is kept for (default: requests' 10)
+        """
+        import firebase_admin
+        from firebase_admin import credentials, db
+        
+        try:
+            firebase_admin.get_app()
+        except ValueError:
+            cred = credentials.Certificate(service_account_path)
+            firebase_admin.initialize_app(cred, {
+                'databaseURL': database_url
+            })
+        self.db = db
+        if pool_size or pool_hosts:
+            self.configure_pool(pool_size or 10, pool_hosts or 10)
+            
+    def configure_pool(self, pool_size, pool_hosts=10):
+        """Replace the HTTP connection pools of the database client
+        
+        firebase_admin keeps one client (and requests session) per database URL,
+        shared by every reference and thread, but with requests' default pool of
+        10 connections: with more threads than that, connections are closed after
+        each call and the next one pays for a new TLS handshake. The retry
+        settings of the client are kept.
+        
+        Args:
+            pool_size: Keep-alive connections kept per host
+            pool_hosts: Hosts a connection pool is kept for
+        """
+        from requests.adapters import HTTPAdapter
+        
+        session = self.db.reference('/')._client.session
+        for prefix in ('https://', 'http://'):
+            retries = session.get_adapter(prefix).max_retries
+            session.mount(prefix, HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_size,
+                                              max_retries=retries))
+        print(f"🔌 HTTP connection pool: {pool_size} connections per host, {pool_hosts} hosts")
+        
+    def reference(self, path='/'):
+        return self.db.reference(path)
+
+class InMemoryBackend(DatabaseBackend):
+    """Thread-safe in-process stand-in for the Realtime Database
+    
+    Stores a JSON tree and gives listeners the same put/patch events the real
+    database streams, each listener on its own delivery thread, so GameManager,
+    VirtualPlayer and discovery can run at full speed without credentials or a
+    network. Given a scheduler (e.g. a SimulatedScheduler), events are delivered
+    as scheduled calls instead, in the order they happened and with no threads.
+    """
+    
+    def __init__(self, data=None, scheduler=None):
+        self.root = _normalize(copy.deepcopy(data))
+        self.lock = threading.RLock()
+        self.listeners = []  # InMemoryListener
+        self.scheduler = scheduler
+        
+    def reference(self, path='/'):
+        return InMemoryReference(self, _split_path(path))
+        
+    def _value_at(self, parts):
+        node = self.root
+        for part in parts:
+            if not isinstance(node, dict):
+                return None
+            node = node.get(part)
+        return node
+        
+    def _write(self, parts, value):
+        """Store value at parts (None deletes), pruning nodes left empty (lock held)"""
+        value = _normalize(copy.deepcopy(value))
+        if not parts:
+            self.root = value
+            return
+            
+        if not isinstance(self.root, dict):
+            if value is None:
+                return
+            self.root = {}
+            
+        node = self.root
+        parents = []
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                if value is None:
+                    return
+                child = node[part] = {}
+            parents.append((node, part))
+            node = child
+            
+        if value is None:
+            node.pop(parts[-1], None)
+            while not node and parents:
+                parent, key = parents.pop()
+                del parent[key]
+                node = parent
+            if not self.root:
+                self.root = None
+        else:
+            node[parts[-1]] = value
+            
+    def _commit(self, parts, writes, event_type, data):
+        """Apply writes [(parts, value)] made at parts and notify listeners (lock held)
+        
+        Listeners at or above parts get the write as one put/patch event; listeners
+        below it get a put of their new value if it changed.
+        """
+        writes = [(write_parts, _server_values(value)) for write_parts, value in writes]
+        data = _server_values(data)
+        below = [listener for listener in self.listeners if _is_prefix(parts, listener.parts) and listener.parts != parts]
+        before = [copy.deepcopy(self._value_at(listener.parts)) for listener in below]
+        
+        for write_parts, value in writes:
+            self._write(write_parts, value)
+            
+        for listener in self.listeners:
+            if _is_prefix(listener.parts, parts):
+                relative = '/' + '/'.join(parts[len(listener.parts):])
+                listener.put(GameEvent(event_type, relative, copy.deepcopy(data)))
+                
+        for listener, old_value in zip(below, before):
+            new_value = self._value_at(listener.parts)
+            if new_value != old_value:
+                listener.put(GameEvent('put', '/', copy.deepcopy(new_value)))
+
+class InMemoryReference:
+    """A location in an InMemoryBackend, with the db.Reference methods the monitor uses"""
+    
+    def __init__(self, backend, parts):
+        self.backend = backend
+        self.parts = parts
+        
+    @property
+    def key(self):
+        return self.parts[-1] if self.parts else None
+        
+    @property
+    def path(self):
+        return '/' + '/'.join(self.parts)
+        
+    @property
+    def parent(self):
+        return InMemoryReference(self.backend, self.parts[:-1]) if self.parts else None
+        
+    def child(self, path):
+        return InMemoryReference(self.backend, self.parts + _split_path(path))
+        
+    def get(self, etag=False, shallow=False):
+        if etag and shallow:
+            raise ValueError('etag and shallow cannot both be set to True.')
+        with self.backend.lock:
+            value = self.backend._value_at(self.parts)
+            if shallow and isinstance(value, dict):
+                return {key: True for key in value}
+            value = copy.deepcopy(value)
+        return (value, _etag(value)) if etag else value
+        
+    def get_if_changed(self, etag):
+        value, current_etag = self.get(etag=True)
+        if current_etag == etag:
+            return False, None, None
+        return True, value, current_etag
+        
+    def set(self, value):
+        if value is None:
+            raise ValueError('Value must not be None.')
+        with self.backend.lock:
+            self.backend._commit(self.parts, [(self.parts, value)], 'put', value)
+            
+    def set_if_unchanged(self, expected_etag, value):
+        if not isinstance(expected_etag, str):
+            raise ValueError('Expected ETag must be a string.')
+        if value is None:
+            raise ValueError('Value must not be none.')
+        with self.backend.lock:
+            current = self.backend._value_at(self.parts)
+            if _etag(current) != expected_etag:
+                return False, copy.deepcopy(current), _etag(current)
+            self.backend._commit(self.parts, [(self.parts, value)], 'put', value)
+            return True, copy.deepcopy(value), _etag(value)
+            
+    def update(self, value):
+        if not value or not isinstance(value, dict):
+            raise ValueError('Value argument must be a non-empty dictionary.')
+        writes = [(self.parts + _split_path(key), child) for key, child in value.items()]
+        with self.backend.lock:
+            self.backend._commit(self.parts, writes, 'patch', value)
+            
+    def delete(self):
+        with self.backend.lock:
+            self.backend._commit(self.parts, [(self.parts, None)], 'put', None)
+            
+    def push(self, value=''):
+        child = self.child(_push_id())
+        child.set(value)
+        return child
+        
+    def listen(self, callback):
+        listener = InMemoryListener(self.backend, self.parts, callback)
+        with self.backend.lock:
+            self.backend.listeners.append(listener)
+            # Like the real stream, start with the current value at the location
+            listener.put(GameEvent('put', '/', copy.deepcopy(self.backend._value_at(self.parts))))
+        listener.start()
+        return listener
+        
+    def transaction(self, transaction_update):
+        if not callable(transaction_update):
+            raise ValueError('transaction_update must be a function.')
+        with self.backend.lock:
+            new_value = transaction_update(copy.deepcopy(self.backend._value_at(self.parts)))
+            if new_value is None:
+                # firebase_admin hands the result to set_if_unchanged, which rejects None
+                raise ValueError('Value must not be none.')
+            self.backend._commit(self.parts, [(self.parts, new_value)], 'put', new_value)
+            return new_value
+            
+    def order_by_child(self, path):
+        return InMemoryQuery(self, _split_path(path))
+        
+    def order_by_key(self):
+        return InMemoryQuery(self, '$key')
+        
+    def order_by_value(self):
+        return InMemoryQuery(self, '$value')
+
+class InMemoryQuery:
+    """Ordered/filtered read of the children of an InMemoryReference"""
+    
+    def __init__(self, ref, order_by):
+        self.ref = ref
+        self.order_by = order_by  # '$key', '$value' or the parts of a child path
+        self.start = None
+        self.end = None
+        self.first = None
+        self.last = None
+        
+    def start_at(self, start):
+        self.start = start
+        return self
+        
+    def end_at(self, end):
+        self.end = end
+        return self
+        
+    def equal_to(self, value):
+        self.start = self.end = value
+        return self
+        
+    def limit_to_first(self, limit):
+        self.first = limit
+        return self
+        
+    def limit_to_last(self, limit):
+        self.last = limit
+        return self
+        
+    def _index(self, key, value):
+        if self.order_by == '$key':
+            return key
+        if self.order_by == '$value':
+            return value
+        for part in self.order_by:
+            value = value.get(part) if isinstance(value, dict) else None
+        return value
+        
+    def get(self):
+        children = self.ref.get()
+        if not isinstance(children, dict):
+            return children
+            
+        entries = sorted(
+            ((_sort_key(self._index(key, value)), _sort_key(key), key, value) for key, value in children.items()),
+            key=lambda entry: (entry[0], entry[1])
+        )
+        if self.start is not None:
+            entries = [entry for entry in entries if entry[0] >= _sort_key(self.start)]
+        if self.end is not None:
+            entries = [entry for entry in entries if entry[0] <= _sort_key(self.end)]
+        if self.first is not None:
+            entries = entries[:self.first]
+        if self.last is not None:
+            entries = entries[-self.last:]
+        return collections.OrderedDict((key, value) for _, _, key, value in entries)
+
+class InMemoryListener:
+    """Delivers the events of one listen() call on its own thread, like db.ListenerRegistration
+    
+    With a backend scheduler, events are delivered through it instead of a thread.
+    """
+    
+    def __init__(self, backend, parts, callback):
+        self.backend = backend
+        self.parts = parts
+        self.callback = callback
+        self.closed = False
+        self.queue = queue.Queue()
+        self.thread = None
+        if backend.scheduler is None:
+            self.thread = threading.Thread(target=self._deliver, name='in-memory-listener', daemon=True)
+        
+    def start(self):
+        if self.thread:
+            self.thread.start()
+            
+    def put(self, event):
+        """Queue an event for delivery (backend lock held, so events keep their order)"""
+        if self.thread:
+            self.queue.put(event)
+        else:
+            self.backend.scheduler.call_later(0, self._deliver_one, event)
+        
+    def _deliver(self):
+        while True:
+            event = self.queue.get()
+            if event is None:
+                return
+            self._deliver_one(event)
+            
+    def _deliver_one(self, event):
+        if self.closed:
+            return
+        try:
+            self.callback(event)
+        except Exception as e:
+            print(f"In-memory listener at /{'/'.join(self.parts)}: callback error: {e}")
+            metrics.inc('errors_total', where='listener_callback')
+                
+    def close(self):
+        with self.backend.lock:
+            if self in self.backend.listeners:
+                self.backend.listeners.remove(self)
+        self.closed = True
+        if self.thread:
+            self.queue.put(None)
+            if threading.current_thread() is not self.thread:
+                self.thread.join()
+
+def _split_path(path):
+    return [part for part in path.split('/') if part]
+
+def _is_prefix(prefix, parts):
+    return parts[:len(prefix)] == prefix
+
+def _normalize(value):
+    """Drop None children and empty objects, which the database doesn't store"""
+    if isinstance(value, dict):
+        value = {str(key): _normalize(child) for key, child in value.items()}
+        value = {key: child for key, child in value.items() if child is not None}
+        return value or None
+    return value
+
+def _server_values(value):
+    """Replace {'.sv': 'timestamp'} placeholders with the time of the write, like the database"""
+    if isinstance(value, dict):
+        if value == {'.sv': 'timestamp'}:
+            return int(clock.time() * 1000)
+        return {key: _server_values(child) for key, child in value.items()}
+    return value
+
+def _etag(value):
+    return hashlib.md5(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+
+def _sort_key(value):
+    """Order values like the database: null, false, true, numbers, strings, objects"""
+    if value is None:
+        return (0, 0)
+    if value is False:
+        return (1, 0)
+    if value is True:
+        return (2, 0)
+    if isinstance(value, (int, float)):
+        return (3, value)
+    if isinstance(value, str):
+        return (4, value)
+    return (5, 0)
+
+_push_lock = threading.Lock()
+_last_push = [0, 0]
+
+def _push_id():
+    """Chronologically ordered unique key, like the database's push IDs"""
+    with _push_lock:
+        now = int(clock.time() * 1000)
+        _last_push[1] = _last_push[1] + 1 if now == _last_push[0] else 0
+        _last_push[0] = now
+        return f"-{now:013d}{_last_push[1]:04d}{rng.randint(0, 0xFFFF):04x}"
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def set_backend(backend):
+    """Use backend for every database call made from now on"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+def get_backend():
+    """The current backend (Firebase, initialized on first use, unless set_backend was called)"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = FirebaseBackend()
+        return _backend
+
+def reference(path='/'):
+    """A reference to path in the current backend (calls through it are counted in metrics)"""
+    return InstrumentedReference(get_backend().reference(path))
+
+class ReadCache:
+    """Last value and ETag of recently read paths, for conditional reads
+    
+    A path read before is read again with get_if_changed(): when nothing under
+    it changed the database answers 304 with no body and the cached value is
+    used, so repeated reads of unchanged data cost a round trip but no download.
+    The least recently read paths are dropped past max_entries. Thread-safe.
+    
+    Meant for small values read often (flags, a game's players): every entry
+    keeps a copy of its value, so large subtrees such as all of 'games' don't
+    belong here. Values returned after a miss are the cached ones and must not
+    be modified.
+    """
+    
+    def __init__(self, max_entries=1024):
+        """Initialize an empty cache
+        
+        Args:
+            max_entries: Paths kept at most
+        """
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()  # path -> (value, etag)
+        self.lock = threading.Lock()
+        
+    def get(self, ref):
+        """The value at ref, read conditionally if the path is cached
+        
+        Args:
+            ref: Reference to read (plain reads only: no query, no shallow)
+        """
+        path = ref.path
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None:
+                self.entries.move_to_end(path)
+                
+        if entry is not None:
+            changed, value, etag = ref.get_if_changed(entry[1])
+            if not changed:
+                metrics.inc('read_cache_hits_total')
+                return copy.deepcopy(entry[0])
+        else:
+            value, etag = ref.get(etag=True)
+        metrics.inc('read_cache_misses_total')
+        
+        with self.lock:
+            # Just fetched, so nothing else holds the value: cache it as is
+            self.entries[path] = (value, etag)
+            self.entries.move_to_end(path)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return value
+        
+    def clear(self):
+        """Forget every cached path"""
+        with self.lock:
+            self.entries.clear()
+            
+    def __len__(self):
+        return len(self.entries)
+
+read_cache = None
+
+def set_read_cache(cache):
+    """Use cache for the repeated reads of cached_get (None reads everything in full)"""
+    global read_cache
+    read_cache = cache
+
+def cached_get(ref):
+    """ref.get(), through the read cache if one is set"""
+    if read_cache is None:
+        return ref.get()
+    return read_cache.get(ref)
@@ -0,0 +1,193 @@
+"""Batching of writes to a game into multi-path updates"""
+
+import threading
+import copy
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from .clocks import clock
+from .instrumentation import metrics
+from .backends import reference
+
+class WriteBatcher:
+    """Merges writes to the same game into multi-path update() calls
+    
+    Writes are queued per game and sent as a single update at games/{game_id} once
+    the game's flush window has passed or max_batch_size paths are pending. Each
+    write gets a Future that resolves (or raises) with the update that carried it,
+    so callers can still report errors per write.
+    
+    Batches are timed by a thread of their own, or, given a scheduler (e.g. a
+    SimulatedScheduler), by calls scheduled on it and sent from those calls.
+    """
+    
+    def __init__(self, flush_window=0.25, max_batch_size=100, max_senders=4, scheduler=None):
+        self.flush_window = flush_window
+        self.max_batch_size = max_batch_size
+        self.scheduler = scheduler
+        self.pending = {}  # game_id -> _PendingBatch
+        self.in_flight = set()  # Games with a batch being sent (one at a time keeps writes ordered)
+        self.cond = threading.Condition()
+        self.running = True
+        self.senders = None
+        self.thread = None
+        if scheduler is None:
+            self.senders = ThreadPoolExecutor(max_workers=max_senders, thread_name_prefix='write-batcher')
+            self.thread = threading.Thread(target=self._run, name='write-batcher', daemon=True)
+            self.thread.start()
+        
+    def write(self, game_id, path, value):
+        """Queue a write of value (None deletes) at games/{game_id}/{path}
+        
+        Returns:
+            A Future for the result of the write
+        """
+        future = Future()
+        parts = [part for part in path.split('/') if part]
+        if not parts:
+            raise ValueError("Batched writes need a path inside the game")
+            
+        with self.cond:
+            if not self.running:
+                raise RuntimeError("WriteBatcher has been closed")
+                
+            batch = self.pending.get(game_id)
+            if batch is None:
+                batch = self.pending[game_id] = _PendingBatch(clock.monotonic() + self.flush_window)
+                if self.scheduler is not None:
+                    self.scheduler.call_later(self.flush_window, self._send_scheduled, game_id, batch)
+                    
+            batch.add(parts, value, future)
+            if len(batch.writes) >= self.max_batch_size:
+                batch.deadline = 0
+                if self.scheduler is not None:
+                    self.scheduler.call_later(0, self._send_scheduled, game_id, batch)
+            self.cond.notify()
+            
+        return future
+        
+    def flush(self, game_id=None, wait_for_result=False):
+        """Send the pending writes of one game (or all games) without waiting for the window
+        
+        Args:
+            game_id: Game to flush, or None for all games
+            wait_for_result: Block until the flushed writes have completed
+        """
+        with self.cond:
+            game_ids = [game_id] if game_id is not None else list(self.pending)
+            futures = []
+            for pending_game_id in game_ids:
+                batch = self.pending.get(pending_game_id)
+                if batch:
+                    batch.deadline = 0
+                    futures.extend(batch.futures())
+            self.cond.notify()
+            
+        if self.scheduler is not None:
+            # No thread to hand the batches to: send them now
+            for pending_game_id in game_ids:
+                self._send_scheduled(pending_game_id, self.pending.get(pending_game_id))
+        elif wait_for_result and futures:
+            wait(futures)
+            
+    def close(self):
+        """Send everything still pending and stop the batcher"""
+        if self.scheduler is not None:
+            self.flush()
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        if self.thread:
+            self.thread.join()
+            self.senders.shutdown(wait=True)
+            
+    def _send_scheduled(self, game_id, batch):
+        """Send a game's batch from a scheduled call, if it is still the one pending"""
+        with self.cond:
+            if batch is None or self.pending.get(game_id) is not batch:
+                return
+            del self.pending[game_id]
+            self.in_flight.add(game_id)
+        self._send(game_id, batch)
+        
+    def _run(self):
+        with self.cond:
+            while self.running or self.pending:
+                now = clock.monotonic()
+                next_deadline = None
+                
+                for game_id, batch in list(self.pending.items()):
+                    if game_id in self.in_flight:
+                        continue
+                    if batch.deadline <= now or not self.running:
+                        del self.pending[game_id]
+                        self.in_flight.add(game_id)
+                        self.senders.submit(self._send, game_id, batch)
+                    elif next_deadline is None or batch.deadline < next_deadline:
+                        next_deadline = batch.deadline
+                        
+                if not self.running and not self.pending:
+                    break
+                    
+                timeout = None if next_deadline is None else max(0, next_deadline - now)
+                self.cond.wait(timeout)
+                
+            # Let the last batches finish before the sender pool shuts down
+            while self.in_flight:
+                self.cond.wait()
+                
+    def _send(self, game_id, batch):
+        try:
+            updates = {'/'.join(parts): value for parts, (value, _) in batch.writes.items()}
+            metrics.inc('batched_paths_total', len(updates))
+            reference(f'games/{game_id}').update(updates)
+            for future in batch.futures():
+                future.set_result(None)
+        except Exception as e:
+            for future in batch.futures():
+                future.set_exception(e)
+        finally:
+            with self.cond:
+                self.in_flight.discard(game_id)
+                self.cond.notify()
+
+class _PendingBatch:
+    """Writes waiting to be sent for one game, keyed by path (as a tuple of parts)"""
+    
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.writes = {}  # path parts -> (value, [futures])
+        
+    def add(self, parts, value, future):
+        """Add a write, folding it into pending writes at overlapping paths
+        
+        Multi-path updates reject paths that contain one another, so the batch is
+        kept free of overlaps while giving the same result as writing in order.
+        """
+        parts = tuple(parts)
+        
+        # An ancestor is already pending: write into its value instead
+        for length in range(1, len(parts)):
+            ancestor = parts[:length]
+            if ancestor in self.writes:
+                ancestor_value, futures = self.writes[ancestor]
+                ancestor_value = copy.deepcopy(ancestor_value) if isinstance(ancestor_value, dict) else {}
+                node = ancestor_value
+                for part in parts[length:-1]:
+                    if not isinstance(node.get(part), dict):
+                        node[part] = {}
+                    node = node[part]
+                if value is None:
+                    node.pop(parts[-1], None)
+                else:
+                    node[parts[-1]] = value
+                self.writes[ancestor] = (ancestor_value or None, futures + [future])
+                return
+                
+        # Replaces any pending writes at the same path or below it
+        futures = [future]
+        for pending in [p for p in self.writes if p[:len(parts)] == parts]:
+            futures = self.writes.pop(pending)[1] + futures
+        self.writes[parts] = (value, futures)
+        
+    def futures(self):
+        return [future for _, futures in self.writes.values() for future in futures]
@@ -0,0 +1,243 @@
+"""Virtual players and the roster they pick targets from"""
+
+import sys
+import threading
+import json
+
+from .constants import ActionType, Role, SELF_PROTECT_CHANCE
+from .clocks import clock, rng
+from .instrumentation import metrics
+from .backends import cached_get, reference
+
+class RosterSnapshot:
+    """Players of a game at one point of a phase, shared by all the bots acting in it
+    
+    The alive, alive non-mafia and alive-per-role player lists are built once, each
+    with a position index, so picking a random target other than oneself is O(1).
+    """
+    
+    def __init__(self, players_data):
+        self.players = players_data  # player_id -> player data
+        self.alive = []
+        self.non_mafia = []
+        self.by_role = {}  # role -> list of alive player IDs
+        
+        for player_id, data in players_data.items():
+            if not data.get('isAlive', True):
+                continue
+            role = data.get('role')
+            self.alive.append(player_id)
+            self.by_role.setdefault(role, []).append(player_id)
+            if role != Role.MAFIOSO:
+                self.non_mafia.append(player_id)
+                
+        # id(list) -> {player_id: position in that list}
+        self.positions = {
+            id(group): {player_id: i for i, player_id in enumerate(group)}
+            for group in [self.alive, self.non_mafia] + list(self.by_role.values())
+        }
+        
+    @classmethod
+    def fetch(cls, players_ref):
+        """Build a snapshot from a read of the players node"""
+        return cls(players_ref.get() or {})
+        
+    def choose(self, group, exclude=None):
+        """Pick a random player from one of the snapshot's lists, never exclude
+        
+        Returns None if there is no one to pick.
+        """
+        position = self.positions[id(group)].get(exclude)
+        count = len(group) if position is None else len(group) - 1
+        if count <= 0:
+            return None
+            
+        # Draw from the list with exclude's slot removed
+        index = rng.randrange(count)
+        if position is not None and index >= position:
+            index += 1
+        return group[index]
+
+class ActionLog:
+    """JSON-lines file of every action the bots submit, to compare runs (e.g. two simulations with the same seed)"""
+    
+    def __init__(self, path):
+        self.file = open(path, 'w')
+        self.lock = threading.Lock()
+        
+    def record(self, game_id, path, action_data):
+        line = json.dumps({'game': game_id, 'path': path, 'action': action_data}, sort_keys=True)
+        with self.lock:
+            self.file.write(line + '\n')
+            
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+# ActionLog that VirtualPlayer.submit_action records to, if any
+action_log = None
+
+def set_action_log(log):
+    """Record every bot action to log (an ActionLog, or None to stop)"""
+    global action_log
+    action_log = log
+
+def intern_role(role):
+    """The one shared copy of a role string (roles read from the database are new strings every time)"""
+    return sys.intern(role) if isinstance(role, str) else role
+
+class VirtualPlayer:
+    """Class to manage a virtual player's actions in the game
+    
+    Bots are kept small so a monitor can hold very many of them: attributes live
+    in slots, the role is interned and the database references are built when
+    used instead of being stored.
+    """
+    
+    __slots__ = ('game_id', 'player_id', 'player_name', 'role', 'is_alive', 'batcher')
+    
+    def __init__(self, game_id, player_id, player_name, role=None, batcher=None):
+        self.game_id = game_id
+        self.player_id = player_id
+        self.player_name = player_name
+        self.role = intern_role(role)
+        self.is_alive = True
+        self.batcher = batcher  # Optional WriteBatcher for action writes
+        
+    @property
+    def game_ref(self):
+        return reference(f'games/{self.game_id}')
+        
+    @property
+    def player_ref(self):
+        return reference(f'games/{self.game_id}/players/{self.player_id}')
+        
+    @property
+    def actions_ref(self):
+        return reference(f'games/{self.game_id}/actions')
+        
+    def submit_action(self, path, action_data):
+        """Write an action at actions/{path}, batched with other writes to the game if possible"""
+        if action_log is not None:
+            action_log.record(self.game_id, path, action_data)
+        if self.batcher is None:
+            self.actions_ref.child(path).set(action_data)
+            return
+            
+        def on_done(future):
+            if future.exception():
+                print(f"Game {self.game_id}: Error submitting action of {self.player_name}: {future.exception()}")
+                metrics.inc('errors_total', where='submit_action')
+                
+        self.batcher.write(self.game_id, f'actions/{path}', action_data).add_done_callback(on_done)
+        
+    def update_status(self, player_data=None):
+        """Update player status from database
+        
+        Args:
+            player_data: The player's data if the caller already has it (skips the read)
+        """
+        if player_data is None:
+            player_data = cached_get(self.player_ref) or {}
+        self.role = intern_role(player_data.get('role'))
+        self.is_alive = player_data.get('isAlive', True)
+        return self.is_alive and self.role is not None
+        
+    def perform_night_action(self, phase_number, roster=None):
+        """Perform appropriate night action based on role
+        
+        Args:
+            phase_number: The current phase number
+            roster: RosterSnapshot shared by the bots of this phase (read from the database if None)
+        """
+        if not self.is_alive or not self.role:
+            return False
+            
+        if roster is None:
+            roster = RosterSnapshot.fetch(self.game_ref.child('players'))
+            
+        # Choose a random alive target
+        target_id = roster.choose(roster.alive, exclude=self.player_id)
+        
+        if target_id is None:
+            print(f"Game {self.game_id}: No valid targets for {self.player_name}")
+            return False
+        
+        # Determine action type based on role
+        action_type = None
+        if self.role == Role.MAFIOSO:
+            action_type = ActionType.KILL
+            # Filter out other mafia members
+            non_mafia_target = roster.choose(roster.non_mafia, exclude=self.player_id)
+            if non_mafia_target is not None:
+                target_id = non_mafia_target
+        elif self.role == Role.ISPETTORE:
+            action_type = ActionType.INVESTIGATE
+        elif self.role == Role.SGARRISTA:
+            action_type = ActionType.PROTECT
+            # Can protect self
+            if rng.random() < SELF_PROTECT_CHANCE:
+                target_id = self.player_id
+        elif self.role == Role.IL_PRETE:
+            action_type = ActionType.BLESS
+            # Can bless self
+            if rng.random() < SELF_PROTECT_CHANCE:
+                target_id = self.player_id
+        else:
+            # Regular citizens don't have night actions
+            return False
+            
+        if action_type:
+            # Submit the action
+            action_data = {
+                'actionType': action_type,
+                'sourcePlayerId': self.player_id,
+                'targetPlayerId': target_id,
+                'timestamp': int(clock.time() * 1000)
+            }
+            
+            self.submit_action(f'night/{phase_number}/{self.player_id}', action_data)
+            metrics.inc('bot_actions_total', action_type=action_type)
+            print(f"Game {self.game_id}: Player {self.player_name} ({self.role}) performed {action_type} on target {target_id}")
+            return True
+            
+        return False
+        
+    def perform_day_vote(self, phase_number, roster=None):
+        """Vote during the day phase
+        
+        Args:
+            phase_number: The current phase number
+            roster: RosterSnapshot shared by the bots of this phase (read from the database if None)
+        """
+        if not self.is_alive:
+            return False
+            
+        if roster is None:
+            roster = RosterSnapshot.fetch(self.game_ref.child('players'))
+            
+        # Choose a random alive target
+        target_id = roster.choose(roster.alive, exclude=self.player_id)
+        
+        if target_id is None:
+            print(f"Game {self.game_id}: No valid targets for {self.player_name} to vote")
+            return False
+        
+        # If player is mafia, try to avoid voting for other mafia
+        if self.role == Role.MAFIOSO:
+            non_mafia_target = roster.choose(roster.non_mafia, exclude=self.player_id)
+            if non_mafia_target is not None:
+                target_id = non_mafia_target
+        
+        # Submit the vote
+        action_data = {
+            'actionType': ActionType.VOTE,
+            'sourcePlayerId': self.player_id,
+            'targetPlayerId': target_id,
+            'timestamp': int(clock.time() * 1000)
+        }
+        
+        self.submit_action(f'day/{phase_number}/{self.player_id}', action_data)
+        metrics.inc('bot_actions_total', action_type=ActionType.VOTE)
+        print(f"Game {self.game_id}: Player {self.player_name} voted for player {target_id}")
+        return True
@@ -0,0 +1,291 @@
+"""Command line entry point of the bot monitor"""
+
+import time
+import argparse
+import threading
+import collections
+
+from .constants import DATABASE_URL, SERVICE_ACCOUNT_PATH
+from .clocks import VirtualClock, clock, seed_random, set_clock
+from .instrumentation import MetricsDumper, MetricsServer, metrics
+from .backends import FirebaseBackend, InMemoryBackend, ReadCache, get_backend, set_backend, set_read_cache
+from .gateway import CallGateway, GatewayBackend
+from .lobby import LobbyIndex
+from .batching import WriteBatcher
+from .bots import ActionLog, set_action_log
+from .journal import OwnershipJournal
+from .scheduling import BotScheduler, PhaseTiming, SimulatedScheduler
+from .mirror import GameEventDispatcher
+from .resolution import PhaseResolver
+from .manager import GameRegistry, fill_game_room_with_guests, resume_journaled_games, set_ownership_journal
+from .sharding import ShardCoordinator
+from .recording import RecordingBackend, SessionRecorder, run_replay
+from .janitor import Janitor
+from .loadgen import run_load_generator
+
+def build_parser():
+    """The command line options of the bot monitor"""
+    parser = argparse.ArgumentParser(description='Add virtual players to Palermo Justice games and automate gameplay')
+    parser.add_argument('--total', type=int, default=4, help='Total number of players desired in each game')
+    parser.add_argument('--game-id', type=str, default=None, help='Specific game ID to join (optional)')
+    parser.add_argument('--monitor', action='store_true', help='Continuously monitor for new games')
+    parser.add_argument('--interval', type=int, default=5, help='Polling interval in seconds (default: 30)')
+    parser.add_argument('--lobby-index', action='store_true', help='Keep a local index of open lobbies from one change stream instead of scanning all games every interval')
+    parser.add_argument('--multiplex', action='store_true', help='Monitor all games through one shared listener on games instead of two listeners per game')
+    parser.add_argument('--flush-window', type=float, default=0.25, help='Seconds to collect writes to a game into one multi-path update (default: 0.25)')
+    parser.add_argument('--max-batch-size', type=int, default=100, help='Maximum number of paths in one multi-path update (default: 100)')
+    parser.add_argument('--action-delay', type=float, nargs=2, default=[0.5, 1.5], metavar=('LOW', 'HIGH'), help='Range of the random delay before each bot acts (default: 0.5 1.5)')
+    parser.add_argument('--delay-distribution', choices=['uniform', 'exponential'], default='uniform', help='Distribution of the bot action delay (default: uniform)')
+    parser.add_argument('--phase-start-delay', type=float, default=3.0, help='Seconds after a phase starts before bots begin to act (default: 3)')
+    parser.add_argument('--phase-deadline', type=float, default=30.0, help='Seconds after a phase starts by which every bot has acted (default: 30)')
+    parser.add_argument('--workers', type=int, default=8, help='Threads that run due bot actions (default: 8)')
+    parser.add_argument('--shard', action='store_true', help='Share games with other bot worker processes using consistent hashing and per-game leases')
+    parser.add_argument('--worker-id', type=str, default=None, help='Unique ID of this worker in --shard mode (default: hostname-pid)')
+    parser.add_argument('--lease-ttl', type=float, default=30.0, help='Seconds a game lease and worker heartbeat stay valid in --shard mode (default: 30)')
+    parser.add_argument('--resolve-phases', action='store_true', help='Resolve nights and votes of monitored games here as soon as everyone has acted, in one write per phase')
+    parser.add_argument('--resolve-timeout', type=float, default=None, help='With --resolve-phases, also resolve a phase this many seconds after it starts even if not everyone has acted')
+    parser.add_argument('--live-tally', type=float, default=None, metavar='DEBOUNCE', help='Publish a running vote count of monitored games under liveTally/{phase}, at most every DEBOUNCE seconds')
+    parser.add_argument('--loadgen', type=int, default=0, metavar='K', help='Load test: create K games with scripted hosts, play them to the end with bots and report latency percentiles')
+    parser.add_argument('--loadgen-timeout', type=float, default=600.0, help='Seconds to wait for the load test games to finish (default: 600)')
+    parser.add_argument('--loadgen-keep', action='store_true', help='Keep the load test games in the database afterwards')
+    parser.add_argument('--metrics-port', type=int, default=None, help='Serve metrics on this local port at /metrics (Prometheus text) and /metrics.json')
+    parser.add_argument('--metrics-host', type=str, default='127.0.0.1', help='Address to serve metrics on (default: 127.0.0.1)')
+    parser.add_argument('--metrics-dump', type=str, default=None, metavar='PATH', help='Write the metrics as JSON to PATH periodically')
+    parser.add_argument('--metrics-dump-interval', type=float, default=60.0, help='Seconds between metrics dumps (default: 60)')
+    parser.add_argument('--simulate', action='store_true', help='Run in simulated time against an in-process database: time jumps to the next scheduled event (implies --backend memory)')
+    parser.add_argument('--sim-duration', type=float, default=3600.0, help='Simulated seconds to run the monitor for with --simulate (default: 3600)')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for the bots\' random choices, IDs and names')
+    parser.add_argument('--action-log', type=str, default=None, metavar='PATH', help='Write every bot action to PATH as JSON lines')
+    parser.add_argument('--loadgen-pause', type=float, default=0.0, help='Seconds the load test hosts wait before each step (default: 0)')
+    parser.add_argument('--db-rate', type=float, default=None, help='Database calls per second allowed across all games (default: no limit)')
+    parser.add_argument('--db-burst', type=float, default=None, help='Database calls that may go out at once under --db-rate (default: --db-rate)')
+    parser.add_argument('--db-game-rate', type=float, default=None, help='Database calls per second allowed per game (default: no limit)')
+    parser.add_argument('--db-game-burst', type=float, default=None, help='Database calls to one game that may go out at once under --db-game-rate (default: --db-game-rate)')
+    parser.add_argument('--db-retries', type=int, default=None, help='Retries of database calls that fail with a transient error, with jittered exponential backoff (default: 4 with --db-rate/--db-game-rate, none otherwise)')
+    parser.add_argument('--http-pool-size', type=int, default=None, help='Keep-alive Firebase connections shared by all threads (default: --workers + 4, at least 10)')
+    parser.add_argument('--http-pool-hosts', type=int, default=10, help='Database hosts a Firebase connection pool is kept for (default: 10)')
+    parser.add_argument('--read-cache', type=int, default=1024, metavar='PATHS', help='Paths whose last value and ETag are kept so repeated reads only download changes, 0 to disable (default: 1024)')
+    parser.add_argument('--journal', type=str, default=None, metavar='PATH', help='Keep the bots this process owns in a SQLite file and take them back on restart')
+    parser.add_argument('--record', type=str, default=None, metavar='PATH', help='Record every database write and listener event to PATH (msgpack, replaced if it exists) for replay')
+    parser.add_argument('--replay', type=str, default=None, metavar='PATH', help='Replay a --record file into an in-process database and exit')
+    parser.add_argument('--replay-speed', type=float, default=1.0, help='Speed of --replay relative to the recording, 0 for as fast as possible (default: 1)')
+    parser.add_argument('--replay-writes', action='store_true', help='With --replay, also apply the recorded writes')
+    parser.add_argument('--janitor', action='store_true', help='Clean up the games tree once (compact finished games, remove expired games and orphaned bots) and exit')
+    parser.add_argument('--janitor-page-size', type=int, default=100, help='Games the janitor reads per query (default: 100)')
+    parser.add_argument('--janitor-ttl', type=float, default=None, metavar='SECONDS', help='Remove games created more than SECONDS ago, whatever their state')
+    parser.add_argument('--janitor-archive', type=str, default=None, metavar='PATH', help='Append finished and expired games to PATH as JSON lines and delete them instead of compacting them')
+    parser.add_argument('--janitor-rate', type=float, default=10.0, help='Database calls per second the janitor may make (default: 10)')
+    parser.add_argument('--janitor-orphan-grace', type=float, default=600.0, help='Seconds a bot lease must have been expired before its bots are removed (default: 600)')
+    parser.add_argument('--janitor-dry-run', action='store_true', help='Only print what the janitor would do')
+    parser.add_argument('--backend', choices=['firebase', 'memory'], default='firebase', help='Database to use: Firebase, or an empty in-process database for local runs (default: firebase)')
+    parser.add_argument('--service-account', type=str, default=SERVICE_ACCOUNT_PATH, help=f'Firebase service account key file (default: {SERVICE_ACCOUNT_PATH})')
+    parser.add_argument('--database-url', type=str, default=DATABASE_URL, help='Firebase Realtime Database URL')
+    return parser
+
+def main(argv=None):
+    """Run the bot monitor with the given command line arguments (sys.argv if None)"""
+    args = build_parser().parse_args(argv)
+    
+    if args.seed is not None:
+        seed_random(args.seed)
+    action_log = None
+    if args.action_log:
+        action_log = ActionLog(args.action_log)
+        set_action_log(action_log)
+        
+    if args.replay:
+        set_backend(InMemoryBackend())
+        scheduler = BotScheduler(max_workers=args.workers)
+        try:
+            run_replay(args.replay, args.replay_speed, args.replay_writes, scheduler)
+        except KeyboardInterrupt:
+            print("Replay stopped by user")
+        finally:
+            scheduler.stop()
+        return
+        
+    if args.simulate:
+        # Everything runs on this thread in simulated time against an in-process database
+        set_clock(VirtualClock())
+        scheduler = SimulatedScheduler(clock)
+        set_backend(InMemoryBackend(scheduler=scheduler))
+    else:
+        scheduler = BotScheduler(max_workers=args.workers)
+        if args.backend == 'memory':
+            set_backend(InMemoryBackend())
+        else:
+            set_backend(FirebaseBackend(args.service_account, args.database_url,
+                                        pool_size=args.http_pool_size or max(10, args.workers + 4),
+                                        pool_hosts=args.http_pool_hosts))
+            
+    if args.read_cache > 0:
+        set_read_cache(ReadCache(args.read_cache))
+        
+    recorder = None
+    if args.record:
+        recorder = SessionRecorder(args.record)
+        set_backend(RecordingBackend(get_backend(), recorder))
+        
+    # The gateway is opt-in: without any of its options, calls go straight to the backend
+    if args.db_rate or args.db_game_rate or args.db_retries:
+        # Outermost, so a recording shows what actually went out
+        set_backend(GatewayBackend(get_backend(), CallGateway(
+            rate=args.db_rate, burst=args.db_burst, game_rate=args.db_game_rate, game_burst=args.db_game_burst,
+            retries=args.db_retries if args.db_retries is not None else 4
+        )))
+        
+    if args.janitor:
+        janitor = Janitor(page_size=args.janitor_page_size, ttl=args.janitor_ttl,
+                          orphan_grace=args.janitor_orphan_grace, archive_path=args.janitor_archive,
+                          rate=args.janitor_rate, dry_run=args.janitor_dry_run)
+        try:
+            janitor.run()
+        except KeyboardInterrupt:
+            print("Janitor stopped by user")
+        finally:
+            if recorder:
+                recorder.close()
+        return
+    
+    registry = GameRegistry()
+    resolver = PhaseResolver(timeout=args.resolve_timeout) if args.resolve_phases else None
+    coordinator = None
+    lobby_index = None
+    ownership_journal = None
+    dispatcher = None
+    metrics_server = None
+    metrics_dumper = None
+    batcher = WriteBatcher(flush_window=args.flush_window, max_batch_size=args.max_batch_size,
+                           scheduler=scheduler if args.simulate else None)
+    timing = PhaseTiming(
+        start_delay=args.phase_start_delay,
+        low=args.action_delay[0],
+        high=args.action_delay[1],
+        distribution=args.delay_distribution,
+        deadline=args.phase_deadline
+    )
+    
+    try:
+        metrics.gauge_callback('threads_alive', threading.active_count)
+        metrics.gauge_callback('games_managed', lambda: len(registry))
+        metrics.gauge_callback('bots_by_game_state', lambda: collections.Counter(
+            manager.game_state for manager in registry.active_managers() for _ in manager.our_virtual_players
+        ), label='state')
+        
+        if args.metrics_port is not None:
+            metrics_server = MetricsServer(args.metrics_port, args.metrics_host)
+            metrics_server.start()
+            
+        if args.metrics_dump:
+            metrics_dumper = MetricsDumper(args.metrics_dump, args.metrics_dump_interval)
+            metrics_dumper.start(scheduler)
+            
+        if args.multiplex:
+            dispatcher = GameEventDispatcher()
+            
+        if args.lobby_index and not args.game_id:
+            lobby_index = LobbyIndex()
+            lobby_index.start(dispatcher)
+            
+        if dispatcher:
+            dispatcher.start()
+            
+        if args.shard:
+            coordinator = ShardCoordinator(args.worker_id, lease_ttl=args.lease_ttl)
+            coordinator.start(scheduler)
+            
+        if args.simulate:
+            # Deliver the listeners' initial snapshots before any game is touched
+            scheduler.run(until=clock.monotonic())
+        
+        # Shared by every game we process
+        game_options = {
+            'dispatcher': dispatcher,
+            'batcher': batcher,
+            'scheduler': scheduler,
+            'timing': timing,
+            'registry': registry,
+            'coordinator': coordinator,
+            'resolver': resolver,
+            'tally_debounce': args.live_tally
+        }
+        
+        if args.journal:
+            ownership_journal = OwnershipJournal(args.journal)
+            set_ownership_journal(ownership_journal)
+            resumed = resume_journaled_games(ownership_journal, **game_options)
+            if resumed:
+                print(f"♻️ Resumed {len(resumed)} games from {args.journal}")
+                
+        if args.loadgen:
+            run_load_generator(args.loadgen, args.total, game_options, args.loadgen_timeout, args.loadgen_keep,
+                               args.loadgen_pause)
+        else:
+            def monitor_cycle():
+                cycle_started = time.perf_counter()
+                try:
+                    # First, clean up any game managers for games that have finished
+                    registry.prune()
+                
+                    # Then look for new games
+                    # (games we already monitor reuse their manager from the registry)
+                    if args.game_id:
+                        fill_game_room_with_guests(args.game_id, total_players=args.total, **game_options)
+                    else:
+                        # Auto-detect and join all available games
+                        fill_game_room_with_guests(total_players=args.total, lobby_index=lobby_index, **game_options)
+                
+                    print(f"📊 Currently monitoring {len(registry)} active games")
+                except Exception as e:
+                    print(f"Error during monitoring cycle: {e}")
+                    metrics.inc('errors_total', where='monitor_cycle')
+                    # Continue running even after errors
+                metrics.inc('monitor_cycles_total')
+                metrics.observe('monitor_cycle_seconds', time.perf_counter() - cycle_started)
+                
+            # Always run in continuous monitoring mode
+            print(f"Starting monitoring mode, checking for games every {args.interval} seconds...")
+            if args.simulate:
+                def simulated_cycle():
+                    monitor_cycle()
+                    scheduler.call_later(args.interval, simulated_cycle)
+                    
+                scheduler.call_later(0, simulated_cycle)
+                scheduler.run(until=args.sim_duration)
+            else:
+                while True:
+                    monitor_cycle()
+                    print(f"⏳ Waiting {args.interval} seconds before next check...")
+                    time.sleep(args.interval)
+                
+    except KeyboardInterrupt:
+        print("Monitoring stopped by user")
+    except Exception as e:
+        print(f"Critical error occurred: {e}")
+    finally:
+        # Clean up all game managers
+        for gm in registry.active_managers():
+            if hasattr(gm, 'stop_monitoring'):
+                gm.stop_monitoring(immediate=True)
+        
+        if coordinator:
+            coordinator.stop()
+        
+        if lobby_index:
+            lobby_index.stop()
+        if dispatcher:
+            dispatcher.stop()
+        batcher.close()
+        if metrics_dumper:
+            metrics_dumper.stop()
+        scheduler.stop()
+        if metrics_server:
+            metrics_server.stop()
+        if action_log:
+            action_log.close()
+        if recorder:
+            recorder.close()
+        if ownership_journal:
+            ownership_journal.close()
+                
+        print("Script execution completed")
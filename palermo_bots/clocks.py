@@ -0,0 +1,70 @@
+"""Time and randomness used by games and bots, replaceable for simulations"""
+
+import random
+import time
+
+class RealClock:
+    """Wall-clock time"""
+    
+    def time(self):
+        return time.time()
+        
+    def monotonic(self):
+        return time.monotonic()
+        
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+class VirtualClock:
+    """Simulated time that only moves when a SimulatedScheduler advances it"""
+    
+    def __init__(self, start=0.0):
+        self.now = start
+        
+    def time(self):
+        return self.now
+        
+    def monotonic(self):
+        return self.now
+        
+    def advance_to(self, when):
+        self.now = max(self.now, when)
+        
+    def sleep(self, seconds):
+        # Whatever blocks holds up the whole simulation, like it would hold up its thread
+        self.now += seconds
+
+class SwitchableClock:
+    """The clock every module imports; set_clock changes which clock it reads
+    
+    Modules keep the object they imported, so swapping the clock has to happen
+    behind it rather than by rebinding the name.
+    """
+    
+    def __init__(self, source):
+        self.source = source
+        
+    def time(self):
+        return self.source.time()
+        
+    def monotonic(self):
+        return self.source.monotonic()
+        
+    def sleep(self, seconds):
+        self.source.sleep(seconds)
+        
+    def __getattr__(self, name):
+        # advance_to, now, ... of a VirtualClock
+        return getattr(self.source, name)
+
+# Source of timestamps, delays and randomness for games and bots (see set_clock/seed_random)
+clock = SwitchableClock(RealClock())
+rng = random.Random()
+
+def set_clock(new_clock):
+    """Use new_clock for every timestamp and delay from now on"""
+    clock.source = new_clock
+
+def seed_random(seed):
+    """Make the bots' choices, IDs and names reproducible"""
+    rng.seed(seed)
@@ -0,0 +1,70 @@
+"""Game constants shared with the app (same values as Constants.kt and the model classes)"""
+
+# CONFIG
+SERVICE_ACCOUNT_PATH = 'serviceAccountKey.json'
+DATABASE_URL = 'https://palermojusticetest-default-rtdb.europe-west1.firebasedatabase.app/'  # Replace with your URL
+
+# Game state constants
+class GameState:
+    LOBBY = "lobby"
+    NIGHT = "night"
+    NIGHT_RESULTS = "night_results"
+    DAY_DISCUSSION = "day"
+    DAY_VOTING = "voting"
+    EXECUTION_RESULTS = "execution_results"
+    GAME_OVER = "finished"
+    
+# Role constants
+class Role:
+    MAFIOSO = "MAFIOSO"
+    PAESANO = "PAESANO" 
+    ISPETTORE = "ISPETTORE"
+    SGARRISTA = "SGARRISTA"
+    IL_PRETE = "IL_PRETE"
+    
+# Action types
+class ActionType:
+    KILL = "KILL"
+    INVESTIGATE = "INVESTIGATE"
+    PROTECT = "PROTECT"
+    BLESS = "BLESS"
+    VOTE = "VOTE"
+
+# Teams (winningTeam values)
+class Team:
+    MAFIA = "MAFIA"
+    CITIZENS = "CITIZENS"
+
+# Role names shown to players
+ROLE_DISPLAY_NAMES = {
+    Role.MAFIOSO: "Mafioso",
+    Role.PAESANO: "Paesano",
+    Role.ISPETTORE: "Ispettore",
+    Role.SGARRISTA: "Sgarrista",
+    Role.IL_PRETE: "Il Prete"
+}
+
+# Night action of each role (roles not listed have none)
+NIGHT_ACTIONS = {
+    Role.MAFIOSO: ActionType.KILL,
+    Role.ISPETTORE: ActionType.INVESTIGATE,
+    Role.SGARRISTA: ActionType.PROTECT,
+    Role.IL_PRETE: ActionType.BLESS
+}
+
+# Role counts by number of players (same as Constants.ROLE_DISTRIBUTION in the app)
+MIN_PLAYERS = 4
+ROLE_DISTRIBUTION = {
+    4: {Role.MAFIOSO: 1, Role.PAESANO: 2, Role.ISPETTORE: 1, Role.SGARRISTA: 0, Role.IL_PRETE: 0},
+    5: {Role.MAFIOSO: 1, Role.PAESANO: 3, Role.ISPETTORE: 1, Role.SGARRISTA: 0, Role.IL_PRETE: 0},
+    6: {Role.MAFIOSO: 2, Role.PAESANO: 3, Role.ISPETTORE: 1, Role.SGARRISTA: 0, Role.IL_PRETE: 0},
+    7: {Role.MAFIOSO: 2, Role.PAESANO: 3, Role.ISPETTORE: 1, Role.SGARRISTA: 1, Role.IL_PRETE: 0},
+    8: {Role.MAFIOSO: 2, Role.PAESANO: 4, Role.ISPETTORE: 1, Role.SGARRISTA: 1, Role.IL_PRETE: 0},
+    9: {Role.MAFIOSO: 3, Role.PAESANO: 4, Role.ISPETTORE: 1, Role.SGARRISTA: 1, Role.IL_PRETE: 0},
+    10: {Role.MAFIOSO: 3, Role.PAESANO: 4, Role.ISPETTORE: 1, Role.SGARRISTA: 1, Role.IL_PRETE: 0},
+    11: {Role.MAFIOSO: 3, Role.PAESANO: 5, Role.ISPETTORE: 1, Role.SGARRISTA: 1, Role.IL_PRETE: 0},
+    12: {Role.MAFIOSO: 4, Role.PAESANO: 5, Role.ISPETTORE: 1, Role.SGARRISTA: 1, Role.IL_PRETE: 0}
+}
+
+# Chance that a bot Sgarrista / Il Prete protects itself instead of another player
+SELF_PROTECT_CHANCE = 0.3
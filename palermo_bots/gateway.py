@@ -0,0 +1,295 @@
+"""Rate limiting, retries and write coalescing for database calls"""
+
+import threading
+from concurrent.futures import Future, wait
+
+from .clocks import clock, rng
+from .instrumentation import metrics
+from .backends import DatabaseBackend, _split_path
+
+class TokenBucket:
+    """Rate limiter allowing rate calls per second on average and bursts of up to burst calls"""
+    
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst) if burst is not None else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = clock.monotonic()
+        self.lock = threading.Lock()
+        
+    def reserve(self, tokens=1):
+        """Take tokens now, borrowing from the future if there aren't enough
+        
+        Returns:
+            Seconds to wait before using them (0 if they were available)
+        """
+        with self.lock:
+            now = clock.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+            
+    def acquire(self, tokens=1):
+        """Block until tokens may be used"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            clock.sleep(wait)
+
+class CallGateway:
+    """Central throttle, retry policy and write coalescing for database calls
+    
+    Every call waits for a token from the global bucket and from the bucket of
+    its game (paths under games/{game_id}), so a burst at the start of a phase is
+    spread out instead of running into quota errors. Calls failing with a
+    transient error (network errors, UNAVAILABLE, RESOURCE_EXHAUSTED, ...) are
+    retried after an exponentially growing, jittered delay. A set or delete of a
+    path that is still waiting for its turn is folded into the pending one, so
+    only the last value goes out and both callers get its result.
+    
+    Writes (set, delete, update, set_if_unchanged, transaction) go out in the
+    order they were made whenever their paths overlap (one is at or under the
+    other), and a pending set stops taking later values as soon as a write to
+    an overlapping path comes after it, so no value can overtake a newer one.
+    """
+    
+    TRANSIENT_CODES = ('UNAVAILABLE', 'DEADLINE_EXCEEDED', 'RESOURCE_EXHAUSTED', 'INTERNAL', 'ABORTED')
+    # Retrying a push could create the child twice
+    RETRIED_KINDS = ('get', 'get_if_changed', 'query', 'set', 'set_if_unchanged', 'update', 'delete', 'transaction')
+    
+    def __init__(self, rate=None, burst=None, game_rate=None, game_burst=None, retries=4, base_delay=0.2,
+                 max_delay=10.0):
+        """
+        Args:
+            rate: Calls per second across all games (None for no limit)
+            burst: Calls the global bucket can save up (defaults to rate)
+            game_rate: Calls per second to one game (None for no limit)
+            game_burst: Calls a game's bucket can save up (defaults to game_rate)
+            retries: Retries of a call that failed with a transient error
+            base_delay: Seconds before the first retry, doubled for each following one
+            max_delay: Longest delay between retries
+        """
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.game_rate = game_rate
+        self.game_burst = game_burst
+        self.game_buckets = {}  # game_id -> TokenBucket
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.pending_writes = {}  # path -> [value, Future] of a set/delete that later ones can fold into
+        self.writes = {}  # sequence number -> (path parts, Future) of the writes queued or in flight
+        self.sequence = 0
+        self.lock = threading.Lock()
+        
+    @staticmethod
+    def game_of(path):
+        parts = _split_path(path)
+        return parts[1] if len(parts) >= 2 and parts[0] == 'games' else None
+        
+    def throttle(self, path):
+        """Wait for a global token and one of the path's game"""
+        wait = self.bucket.reserve() if self.bucket else 0.0
+        game_id = self.game_of(path)
+        if self.game_rate and game_id is not None:
+            with self.lock:
+                bucket = self.game_buckets.get(game_id)
+                if bucket is None:
+                    if len(self.game_buckets) >= 10000:
+                        # Buckets that have filled up again are as good as new ones
+                        now = clock.monotonic()
+                        self.game_buckets = {
+                            gid: b for gid, b in self.game_buckets.items()
+                            if b.tokens + (now - b.updated) * b.rate < b.capacity
+                        }
+                    bucket = self.game_buckets[game_id] = TokenBucket(self.game_rate, self.game_burst)
+            wait = max(wait, bucket.reserve())
+        if wait > 0:
+            metrics.observe('gateway_throttled_seconds', wait)
+            clock.sleep(wait)
+            
+    def is_transient(self, error):
+        return isinstance(error, OSError) or getattr(error, 'code', None) in self.TRANSIENT_CODES
+        
+    def call(self, path, kind, method, *args, **kwargs):
+        """Make a database call at path under the rate limits, retrying transient errors"""
+        self.throttle(path)
+        return self._attempt(path, kind, method, *args, **kwargs)
+        
+    def _attempt(self, path, kind, method, *args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return method(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.retries or kind not in self.RETRIED_KINDS or not self.is_transient(e):
+                    metrics.inc('gateway_failures_total', kind=kind)
+                    raise
+                # Full jitter: anywhere up to the exponential delay
+                delay = rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                attempt += 1
+                print(f"Database {kind} of {path} failed ({e}), retry {attempt}/{self.retries} in {delay:.2f}s")
+                metrics.inc('gateway_retries_total', kind=kind)
+                clock.sleep(delay)
+                # A retry takes a token like any other call
+                self.throttle(path)
+                
+    def write(self, path, value, send):
+        """Set (or with value None, delete) path through send(value), coalescing with a pending write"""
+        with self.lock:
+            pending = self.pending_writes.get(path)
+            if pending is not None:
+                # A write to the path is still waiting for its turn: it sends our value instead
+                pending[0] = value
+                metrics.inc('gateway_writes_coalesced_total')
+                future = pending[1]
+                queued = False
+            else:
+                future = Future()
+                pending = [value, future]
+                sequence, earlier = self._enqueue(path, future)
+                self.pending_writes[path] = pending
+                queued = True
+        if not queued:
+            return future.result()
+            
+        self.throttle(path)
+        with self.lock:
+            if self.pending_writes.get(path) is pending:
+                del self.pending_writes[path]
+            value = pending[0]
+        return self._send_in_order(path, 'set' if value is not None else 'delete', sequence, earlier, future,
+                                   send, value)
+        
+    def ordered_call(self, path, kind, method, *args, **kwargs):
+        """Make a write that isn't coalesced (update, transaction, ...) in order with the writes around it"""
+        future = Future()
+        with self.lock:
+            sequence, earlier = self._enqueue(path, future)
+        self.throttle(path)
+        return self._send_in_order(path, kind, sequence, earlier, future, method, *args, **kwargs)
+        
+    def _enqueue(self, path, future):
+        """Give a write at path its place in line (lock held)
+        
+        Pending set/deletes at overlapping paths stop coalescing, since a value
+        folded into them now would go out before this write.
+        
+        Returns:
+            (sequence number, Futures of the earlier writes to overlapping paths)
+        """
+        parts = _split_path(path)
+        self.sequence += 1
+        for other in [p for p in self.pending_writes if p != path and _overlaps(_split_path(p), parts)]:
+            del self.pending_writes[other]
+        earlier = [f for other, f in self.writes.values() if _overlaps(other, parts)]
+        self.writes[self.sequence] = (parts, future)
+        return self.sequence, earlier
+        
+    def _send_in_order(self, path, kind, sequence, earlier, future, method, *args, **kwargs):
+        # Earlier writes only ever wait for writes older than themselves, so this can't deadlock
+        wait(earlier)
+        try:
+            result = self._attempt(path, kind, method, *args, **kwargs)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.writes[sequence]
+
+def _overlaps(parts, other):
+    """Whether one of two paths (as parts) is at or under the other"""
+    shorter = min(len(parts), len(other))
+    return parts[:shorter] == other[:shorter]
+
+class GatewayBackend(DatabaseBackend):
+    """Backend wrapper that sends every call through a CallGateway"""
+    
+    def __init__(self, backend, gateway):
+        self.backend = backend
+        self.gateway = gateway
+        
+    def reference(self, path='/'):
+        return GatewayReference(self.backend.reference(path), self.gateway)
+
+class GatewayReference:
+    """Reference wrapper for GatewayBackend (listeners pass straight through)"""
+    
+    def __init__(self, ref, gateway):
+        self._ref = ref
+        self._gateway = gateway
+        
+    def __getattr__(self, name):
+        return getattr(self._ref, name)
+        
+    @property
+    def parent(self):
+        parent = self._ref.parent
+        return GatewayReference(parent, self._gateway) if parent is not None else None
+        
+    def child(self, path):
+        return GatewayReference(self._ref.child(path), self._gateway)
+        
+    def get(self, *args, **kwargs):
+        return self._gateway.call(self._ref.path, 'get', self._ref.get, *args, **kwargs)
+        
+    def get_if_changed(self, *args, **kwargs):
+        return self._gateway.call(self._ref.path, 'get_if_changed', self._ref.get_if_changed, *args, **kwargs)
+        
+    def set(self, value):
+        if value is None:
+            # Let the backend reject it as usual
+            return self._ref.set(value)
+        return self._gateway.write(self._ref.path, value, self._send)
+        
+    def delete(self):
+        return self._gateway.write(self._ref.path, None, self._send)
+        
+    def _send(self, value):
+        if value is None:
+            return self._ref.delete()
+        return self._ref.set(value)
+        
+    def set_if_unchanged(self, *args, **kwargs):
+        return self._gateway.ordered_call(self._ref.path, 'set_if_unchanged', self._ref.set_if_unchanged, *args, **kwargs)
+        
+    def update(self, *args, **kwargs):
+        return self._gateway.ordered_call(self._ref.path, 'update', self._ref.update, *args, **kwargs)
+        
+    def push(self, *args, **kwargs):
+        child = self._gateway.call(self._ref.path, 'push', self._ref.push, *args, **kwargs)
+        return GatewayReference(child, self._gateway)
+        
+    def transaction(self, *args, **kwargs):
+        return self._gateway.ordered_call(self._ref.path, 'transaction', self._ref.transaction, *args, **kwargs)
+        
+    def order_by_child(self, *args, **kwargs):
+        return GatewayQuery(self._ref.order_by_child(*args, **kwargs), self._ref.path, self._gateway)
+        
+    def order_by_key(self):
+        return GatewayQuery(self._ref.order_by_key(), self._ref.path, self._gateway)
+        
+    def order_by_value(self):
+        return GatewayQuery(self._ref.order_by_value(), self._ref.path, self._gateway)
+
+class GatewayQuery:
+    """Query wrapper whose get() goes through the gateway as a 'query' call"""
+    
+    def __init__(self, query, path, gateway):
+        self._query = query
+        self._path = path
+        self._gateway = gateway
+        
+    def __getattr__(self, name):
+        attribute = getattr(self._query, name)
+        if not callable(attribute):
+            return attribute
+            
+        def chained(*args, **kwargs):
+            return GatewayQuery(attribute(*args, **kwargs), self._path, self._gateway)
+        return chained
+        
+    def get(self):
+        return self._gateway.call(self._path, 'query', self._query.get)
@@ -0,0 +1,328 @@
+"""Runtime metrics and the instrumented reference wrappers that feed them"""
+
+import time
+import threading
+import bisect
+import os
+import json
+
+class MetricsRegistry:
+    """Counters, gauges and latency histograms of the running process
+    
+    Metrics are created on first use and identified by name plus labels.
+    Gauges can also be callbacks evaluated when the metrics are read, returning
+    a number or a dict of label value -> number.
+    """
+    
+    # Histogram bucket upper bounds, in seconds
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}  # (name, labels) -> value
+        self.gauges = {}  # (name, labels) -> value
+        self.gauge_callbacks = {}  # name -> (label name, callback)
+        self.histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+        
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            
+    def set_gauge(self, name, value, **labels):
+        with self.lock:
+            self.gauges[self._key(name, labels)] = value
+            
+    def add_gauge(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.gauges[key] = self.gauges.get(key, 0) + value
+            
+    def gauge_callback(self, name, callback, label=None):
+        """Read gauge name from callback() when metrics are collected
+        
+        Args:
+            label: Label name for the keys if callback returns a dict
+        """
+        with self.lock:
+            self.gauge_callbacks[name] = (label, callback)
+            
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        index = bisect.bisect_left(self.BUCKETS, seconds)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(self.BUCKETS) + 3)
+            histogram[index] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+            
+    def collect(self):
+        """Current values as (counters, gauges, histograms) dicts keyed by (name, labels)"""
+        with self.lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            histograms = {key: list(value) for key, value in self.histograms.items()}
+            callbacks = list(self.gauge_callbacks.items())
+            
+        for name, (label, callback) in callbacks:
+            try:
+                value = callback()
+            except Exception as e:
+                print(f"Metrics: error reading gauge {name}: {e}")
+                continue
+            if isinstance(value, dict):
+                for label_value, number in value.items():
+                    gauges[(name, ((label, str(label_value)),))] = number
+            else:
+                gauges[(name, ())] = value
+        return counters, gauges, histograms
+        
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+        return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+        
+    def to_prometheus(self):
+        """The metrics in the Prometheus text exposition format"""
+        counters, gauges, histograms = self.collect()
+        lines = []
+        
+        def grouped(values):
+            names = {}
+            for (name, labels), value in sorted(values.items()):
+                names.setdefault(name, []).append((labels, value))
+            return names.items()
+            
+        for name, series in grouped(counters):
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f"{name}{self._labels(labels)} {value}" for labels, value in series)
+        for name, series in grouped(gauges):
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(f"{name}{self._labels(labels)} {value}" for labels, value in series)
+        for name, series in grouped(histograms):
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in series:
+                cumulative = 0
+                for bound, count in zip(self.BUCKETS + ('+Inf',), histogram):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{self._labels(labels)} {histogram[-2]}")
+                lines.append(f"{name}_count{self._labels(labels)} {histogram[-1]}")
+        return '\n'.join(lines) + '\n'
+        
+    def to_dict(self):
+        """The metrics as a JSON-friendly dict: name -> list of {labels, value}"""
+        counters, gauges, histograms = self.collect()
+        result = {'timestamp': time.time(), 'counters': {}, 'gauges': {}, 'histograms': {}}
+        for section, values in (('counters', counters), ('gauges', gauges)):
+            for (name, labels), value in sorted(values.items()):
+                result[section].setdefault(name, []).append({'labels': dict(labels), 'value': value})
+        for (name, labels), histogram in sorted(histograms.items()):
+            result['histograms'].setdefault(name, []).append({
+                'labels': dict(labels),
+                'buckets': dict(zip([str(bound) for bound in self.BUCKETS] + ['+Inf'], histogram)),
+                'sum': histogram[-2],
+                'count': histogram[-1]
+            })
+        return result
+
+metrics = MetricsRegistry()
+
+class MetricsServer:
+    """Serves the metrics over HTTP: /metrics (Prometheus text) and /metrics.json"""
+    
+    def __init__(self, port, host='127.0.0.1', registry=None):
+        import http.server
+        
+        self.registry = registry or metrics
+        registry = self.registry
+        
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = registry.to_prometheus().encode()
+                    content_type = 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body = json.dumps(registry.to_dict()).encode()
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                
+            def log_message(self, format, *args):
+                pass  # No line per scrape
+                
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics-http', daemon=True)
+        
+    def start(self):
+        self.thread.start()
+        print(f"📈 Metrics at http://{self.server.server_address[0]}:{self.server.server_address[1]}/metrics")
+        
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class MetricsDumper:
+    """Writes the metrics as JSON to a file every interval seconds"""
+    
+    def __init__(self, path, interval=60.0, registry=None):
+        self.path = path
+        self.interval = interval
+        self.registry = registry or metrics
+        self.scheduler = None
+        self.timer = None
+        
+    def start(self, scheduler):
+        self.scheduler = scheduler
+        self.timer = scheduler.call_later(self.interval, self.dump)
+        
+    def stop(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        self.write()
+        
+    def dump(self):
+        self.write()
+        self.timer = self.scheduler.call_later(self.interval, self.dump)
+        
+    def write(self):
+        """Replace the file with the current metrics"""
+        try:
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(self.registry.to_dict(), f)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            print(f"Metrics: error writing {self.path}: {e}")
+
+class InstrumentedReference:
+    """Reference wrapper that counts database calls by kind and times them
+    
+    Everything else (key, path, ...) is passed through to the wrapped reference.
+    """
+    
+    def __init__(self, ref):
+        self._ref = ref
+        
+    def __getattr__(self, name):
+        return getattr(self._ref, name)
+        
+    def _call(self, kind, method, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            metrics.inc('database_errors_total', kind=kind)
+            raise
+        finally:
+            metrics.inc('database_calls_total', kind=kind)
+            metrics.observe('database_call_seconds', time.perf_counter() - started, kind=kind)
+            
+    @property
+    def parent(self):
+        parent = self._ref.parent
+        return InstrumentedReference(parent) if parent is not None else None
+        
+    def child(self, path):
+        return InstrumentedReference(self._ref.child(path))
+        
+    def get(self, *args, **kwargs):
+        return self._call('get', self._ref.get, *args, **kwargs)
+        
+    def get_if_changed(self, *args, **kwargs):
+        return self._call('get_if_changed', self._ref.get_if_changed, *args, **kwargs)
+        
+    def set(self, *args, **kwargs):
+        return self._call('set', self._ref.set, *args, **kwargs)
+        
+    def set_if_unchanged(self, *args, **kwargs):
+        return self._call('set_if_unchanged', self._ref.set_if_unchanged, *args, **kwargs)
+        
+    def update(self, *args, **kwargs):
+        return self._call('update', self._ref.update, *args, **kwargs)
+        
+    def delete(self, *args, **kwargs):
+        return self._call('delete', self._ref.delete, *args, **kwargs)
+        
+    def push(self, *args, **kwargs):
+        return InstrumentedReference(self._call('push', self._ref.push, *args, **kwargs))
+        
+    def transaction(self, *args, **kwargs):
+        return self._call('transaction', self._ref.transaction, *args, **kwargs)
+        
+    def order_by_child(self, *args, **kwargs):
+        return InstrumentedQuery(self._ref.order_by_child(*args, **kwargs))
+        
+    def order_by_key(self):
+        return InstrumentedQuery(self._ref.order_by_key())
+        
+    def order_by_value(self):
+        return InstrumentedQuery(self._ref.order_by_value())
+        
+    def listen(self, callback):
+        def counted(event):
+            metrics.inc('database_events_total', event_type=event.event_type)
+            callback(event)
+            
+        listener = self._call('listen', self._ref.listen, counted)
+        metrics.add_gauge('database_listeners_open', 1)
+        return InstrumentedListener(listener)
+
+class InstrumentedQuery:
+    """Query wrapper that counts and times get() as a 'query' call"""
+    
+    def __init__(self, query):
+        self._query = query
+        
+    def __getattr__(self, name):
+        attribute = getattr(self._query, name)
+        if not callable(attribute):
+            return attribute
+            
+        def chained(*args, **kwargs):
+            # start_at/limit_to_first/... return the query for chaining
+            return InstrumentedQuery(attribute(*args, **kwargs))
+        return chained
+        
+    def get(self):
+        started = time.perf_counter()
+        try:
+            return self._query.get()
+        except Exception:
+            metrics.inc('database_errors_total', kind='query')
+            raise
+        finally:
+            metrics.inc('database_calls_total', kind='query')
+            metrics.observe('database_call_seconds', time.perf_counter() - started, kind='query')
+
+class InstrumentedListener:
+    """Listener wrapper that keeps the open listener gauge current"""
+    
+    def __init__(self, listener):
+        self._listener = listener
+        self.closed = False
+        
+    def __getattr__(self, name):
+        return getattr(self._listener, name)
+        
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            metrics.add_gauge('database_listeners_open', -1)
+        self._listener.close()
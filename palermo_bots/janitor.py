@@ -0,0 +1,179 @@
+"""Cleanup of finished games and orphaned bots"""
+
+import time
+import json
+import collections
+
+from .constants import GameState
+from .clocks import clock
+from .instrumentation import metrics
+from .backends import reference
+from .gateway import TokenBucket
+
+class Janitor:
+    """Cleans up the games tree in one pass over bounded, key-ordered pages
+    
+    - Finished games lose their actions, phaseResults, liveTally and botLease
+      (or, with an archive file, are appended to it and deleted).
+    - Games created more than ttl seconds ago are archived if possible and deleted.
+    - Bots (players marked isBot; humans have guest_ IDs too) whose owner is gone
+      are removed from unfinished games:
+      virtual players are disabled (the owner would have removed them) or the
+      game's bot lease has been expired for longer than orphan_grace and its worker
+      has no recent heartbeat.
+      
+    Only one page of games is held at a time, and every database call waits for
+    the token bucket so the janitor doesn't compete with live traffic.
+    """
+    
+    # Per-phase history dropped from finished games
+    HISTORY_KEYS = ('actions', 'phaseResults', 'liveTally', 'botLease')
+    
+    def __init__(self, page_size=100, ttl=None, orphan_grace=600.0, archive_path=None, rate=10.0, dry_run=False):
+        """
+        Args:
+            page_size: Games read per query
+            ttl: Seconds after createdAt when any game is removed (None to keep games forever)
+            orphan_grace: Seconds a bot lease must have been expired before its bots count as orphaned
+            archive_path: JSON-lines file to append games to before deleting them (None to compact in place)
+            rate: Database calls per second
+            dry_run: Only report what would be done
+        """
+        self.page_size = page_size
+        self.ttl = ttl
+        self.orphan_grace = orphan_grace
+        self.archive_path = archive_path
+        self.bucket = TokenBucket(rate)
+        self.dry_run = dry_run
+        self.stats = collections.Counter()
+        self.live_workers = set()
+        
+    def pages(self):
+        """Yield the games one page at a time, as lists of (game_id, game)
+        
+        The REST API doesn't allow shallow reads together with ordering and
+        limits, so each page is a query for the next page_size games by key.
+        """
+        games_ref = reference('games')
+        last_key = None
+        while True:
+            self.bucket.acquire()
+            query = games_ref.order_by_key()
+            if last_key is not None:
+                # start_at is inclusive: ask for one more and skip the last game of the previous page
+                query = query.start_at(last_key).limit_to_first(self.page_size + 1)
+            else:
+                query = query.limit_to_first(self.page_size)
+            page = [(game_id, game) for game_id, game in (query.get() or {}).items() if game_id != last_key]
+            if not page:
+                return
+            last_key = page[-1][0]
+            yield page
+            
+    def run(self):
+        """Sweep every game once, returns a Counter of what was done"""
+        started = time.monotonic()
+        now = int(clock.time() * 1000)
+        
+        # Worker heartbeats are tiny, unlike games, so one read covers the whole pass
+        self.bucket.acquire()
+        heartbeats = reference('botWorkers').get() or {}
+        self.live_workers = {
+            worker_id for worker_id, last_seen in heartbeats.items()
+            if isinstance(last_seen, (int, float)) and now - last_seen <= self.orphan_grace * 1000
+        }
+        
+        archive = open(self.archive_path, 'a') if self.archive_path else None
+        try:
+            for page in self.pages():
+                for game_id, game in page:
+                    self.stats['games'] += 1
+                    try:
+                        self.sweep_game(game_id, game, now, archive)
+                    except Exception as e:
+                        print(f"🧹 Game {game_id}: Error cleaning up: {e}")
+                        metrics.inc('errors_total', where='janitor')
+                print(f"🧹 {self.stats['games']} games checked, up to {page[-1][0]}")
+        finally:
+            if archive:
+                archive.close()
+                
+        self.stats['seconds'] = time.monotonic() - started
+        verb = 'would be' if self.dry_run else 'were'
+        print(f"🧹 Done in {self.stats['seconds']:.1f}s: {self.stats['games']} games checked; "
+              f"{self.stats['compacted']} compacted, {self.stats['archived']} archived and {self.stats['deleted']} deleted, "
+              f"{self.stats['orphans']} orphaned bots removed ({verb})")
+        return self.stats
+        
+    def sweep_game(self, game_id, game, now, archive=None):
+        """Apply the cleanup rules to one game"""
+        if not isinstance(game, dict):
+            return
+        game_ref = reference(f'games/{game_id}')
+        created_at = game.get('createdAt')
+        expired = self.ttl is not None and isinstance(created_at, (int, float)) and now - created_at > self.ttl * 1000
+        finished = game.get('status') == GameState.GAME_OVER
+        
+        if expired or (finished and archive is not None):
+            if archive is not None:
+                archive.write(json.dumps({'id': game_id, 'archivedAt': now, 'game': game}, sort_keys=True) + '\n')
+                archive.flush()
+                self.stats['archived'] += 1
+            self.write(game_ref, None, f"deleted ({'expired' if expired else 'finished'})")
+            self.stats['deleted'] += 1
+            self.release_lease(game_id, game)
+            return
+            
+        if finished:
+            history = {key: None for key in self.HISTORY_KEYS if key in game}
+            if history:
+                self.write(game_ref, history, f"compacted ({', '.join(sorted(history))})")
+                self.stats['compacted'] += 1
+                self.release_lease(game_id, game)
+            return
+            
+        orphans = self.orphaned_bots(game, now)
+        if orphans:
+            self.write(game_ref, {f'players/{player_id}': None for player_id in orphans},
+                       f"removed {len(orphans)} orphaned bots")
+            self.stats['orphans'] += len(orphans)
+            
+    def orphaned_bots(self, game, now):
+        """IDs of the game's bots that nobody is driving any more
+        
+        Only players the bot script marked isBot are considered, and never the host:
+        a game without marked bots (e.g. a game of humans only) is left alone.
+        """
+        bots = [
+            player_id for player_id, player in (game.get('players') or {}).items()
+            if isinstance(player, dict) and player.get('isBot') and player_id != game.get('hostId')
+        ]
+        if not bots:
+            return []
+        if not game.get('virtualPlayersEnabled'):
+            return bots
+            
+        lease = game.get('botLease')
+        if not isinstance(lease, dict):
+            # Single-worker monitors don't take leases; we can't tell whether the owner is alive
+            return []
+        abandoned = now - lease.get('expiresAt', 0) > self.orphan_grace * 1000
+        return bots if abandoned and lease.get('owner') not in self.live_workers else []
+        
+    def release_lease(self, game_id, game):
+        """Drop the game from the list of games its (last) worker held"""
+        lease = game.get('botLease')
+        if isinstance(lease, dict) and lease.get('owner'):
+            self.write(reference(f"botWorkerGames/{lease['owner']}/{game_id}"), None)
+            
+    def write(self, ref, updates, description=None):
+        """Delete ref (updates None) or apply updates to it, at the janitor's rate"""
+        if description:
+            print(f"🧹 {ref.path}: {'would be ' if self.dry_run else ''}{description}")
+        if self.dry_run:
+            return
+        self.bucket.acquire()
+        if updates is None:
+            ref.delete()
+        else:
+            ref.update(updates)
@@ -0,0 +1,64 @@
+"""On-disk journal of the bots a monitor owns"""
+
+import threading
+
+from .clocks import clock
+
+class OwnershipJournal:
+    """SQLite file of the bots this process created, so a restarted monitor can take them back
+    
+    Holds one row per bot (game, bot ID, name) and the last state and phase seen
+    in each of their games. Rows are added when a bot joins and dropped when it is
+    removed or the game ends, so after a crash the file lists exactly the games
+    that still have bots of ours in them.
+    """
+    
+    def __init__(self, path):
+        import sqlite3
+        
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.db:
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('CREATE TABLE IF NOT EXISTS bots ('
+                            'game_id TEXT, player_id TEXT, name TEXT, added REAL, '
+                            'PRIMARY KEY (game_id, player_id))')
+            self.db.execute('CREATE TABLE IF NOT EXISTS games ('
+                            'game_id TEXT PRIMARY KEY, state TEXT, phase INTEGER, updated REAL)')
+            
+    def add_bot(self, game_id, player_id, name):
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO bots VALUES (?, ?, ?, ?)',
+                            (game_id, player_id, name, clock.time()))
+            
+    def remove_bot(self, game_id, player_id):
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM bots WHERE game_id = ? AND player_id = ?', (game_id, player_id))
+            
+    def set_phase(self, game_id, state, phase):
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?)',
+                            (game_id, state, phase, clock.time()))
+            
+    def forget_game(self, game_id):
+        """Drop a game we no longer own bots in"""
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM bots WHERE game_id = ?', (game_id,))
+            self.db.execute('DELETE FROM games WHERE game_id = ?', (game_id,))
+            
+    def games(self):
+        """The journaled games: game_id -> {'state', 'phase', 'bots': {player_id: name}}"""
+        with self.lock:
+            bots = self.db.execute('SELECT game_id, player_id, name FROM bots ORDER BY game_id, added').fetchall()
+            phases = dict((row[0], row[1:]) for row in self.db.execute('SELECT game_id, state, phase FROM games'))
+            
+        games = {}
+        for game_id, player_id, name in bots:
+            state, phase = phases.get(game_id, (None, None))
+            game = games.setdefault(game_id, {'state': state, 'phase': phase, 'bots': {}})
+            game['bots'][player_id] = name
+        return games
+        
+    def close(self):
+        with self.lock:
+            self.db.close()
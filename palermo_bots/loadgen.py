@@ -0,0 +1,306 @@
+"""Load testing with scripted hosts"""
+
+import time
+import threading
+import collections
+import math
+
+from .constants import GameState
+from .clocks import clock, rng
+from .instrumentation import metrics
+from .backends import reference
+from .lobby import assign_roles
+from .bots import RosterSnapshot, VirtualPlayer
+from .scheduling import SimulatedScheduler, default_scheduler
+from .mirror import GameMirror
+from .resolution import PhaseResolver
+from .manager import process_single_game
+
+class LatencyStats:
+    """Latency samples per metric, reported as percentiles"""
+    
+    def __init__(self):
+        self.samples = collections.defaultdict(list)  # metric -> list of seconds
+        self.lock = threading.Lock()
+        
+    def record(self, metric, seconds):
+        with self.lock:
+            self.samples[metric].append(seconds)
+            
+    @staticmethod
+    def percentile(values, percent):
+        """Nearest-rank percentile of a sorted list"""
+        rank = int(math.ceil(percent / 100.0 * len(values)))
+        return values[min(max(rank, 1), len(values)) - 1]
+        
+    def report(self):
+        """One line per metric with its sample count and p50/p95/p99/max in milliseconds"""
+        with self.lock:
+            samples = {metric: sorted(values) for metric, values in self.samples.items() if values}
+            
+        lines = []
+        for metric, values in sorted(samples.items()):
+            p50, p95, p99 = (self.percentile(values, percent) * 1000 for percent in (50, 95, 99))
+            lines.append(f"{metric:<28} n={len(values):<7} p50={p50:9.1f}ms  p95={p95:9.1f}ms  "
+                         f"p99={p99:9.1f}ms  max={values[-1] * 1000:9.1f}ms")
+        return '\n'.join(lines)
+
+class ScriptedHost:
+    """Host of a synthetic game for load tests
+    
+    Creates a lobby with virtual players enabled, starts the game once it is full
+    and advances phases like the app's GameController.advancePhase. Night and
+    voting results are processed with the same chain of reads and writes as the
+    host's phone, unless the game's manager resolves phases itself (PhaseResolver).
+    Night and voting phases are advanced as soon as every alive player has acted.
+    
+    Latencies are recorded in stats:
+        write_to_echo: Host write to its echo on the host's listener
+        action_to_echo: Action timestamp to the action reaching the host's listener
+        phase_start_to_last_action: Night/voting start to the last expected action
+        game_duration: Game start to game over
+    """
+    
+    def __init__(self, total_players, stats, scheduler, resolve_on_server=False, pause=0.0):
+        """
+        Args:
+            total_players: Players (host included) to start the game with
+            stats: LatencyStats to record into
+            scheduler: BotScheduler to run the host's writes on
+            resolve_on_server: Leave night and voting results to the game manager's PhaseResolver
+            pause: Seconds the host waits before each step, like a human host reading the screen
+        """
+        self.total_players = total_players
+        self.pause = pause
+        self.stats = stats
+        self.scheduler = scheduler
+        self.resolve_on_server = resolve_on_server
+        self.rules = PhaseResolver()
+        self.host_id = f"loadhost_{rng.randint(100000, 999999)}"
+        self.game_id = None
+        self.game_ref = None
+        self.listener = None
+        self.player = None  # VirtualPlayer acting for the host once it has a role
+        self.mirror = GameMirror()
+        self.lock = threading.Lock()
+        self.pending_echoes = {}  # path -> (value, write time)
+        self.current_key = None  # (status, phase) last seen
+        self.done_key = None  # (status, phase) the host last advanced from
+        self.phase_started = None
+        self.last_action = None
+        self.seen_actions = set()
+        self.game_started = None
+        self.finished = threading.Event()
+        
+    def create(self):
+        """Create the game as the app's FirebaseManager.createGame does, with bots allowed"""
+        game = {
+            'hostId': self.host_id,
+            'gameCode': str(rng.randint(100000, 999999)),
+            'status': GameState.LOBBY,
+            'createdAt': int(clock.time() * 1000),
+            'virtualPlayersEnabled': True,
+            'players': {self.host_id: {'id': self.host_id, 'name': 'Host', 'isAlive': True}}
+        }
+        self.game_ref = reference('games').push(game)
+        self.game_id = self.game_ref.key
+        self.listener = self.game_ref.listen(self.on_event)
+        return self.game_id
+        
+    def stop(self):
+        if self.listener:
+            self.listener.close()
+            self.listener = None
+            
+    def on_event(self, event):
+        now = clock.time()
+        with self.lock:
+            self.mirror.apply(event.event_type, event.path, event.data)
+            self.check_echoes(now)
+            game = self.mirror.get('/', {})
+            status = game.get('status')
+            phase = game.get('currentPhase', 0)
+            
+            if (status, phase) != self.current_key:
+                self.current_key = (status, phase)
+                self.on_phase_start(status, phase, now)
+            if status in (GameState.NIGHT, GameState.DAY_VOTING):
+                self.note_actions(game, status, phase, now)
+                
+            self.step(game, status, phase)
+            
+    def check_echoes(self, now):
+        """Record the writes whose values have reached the mirror"""
+        for path, (value, written) in list(self.pending_echoes.items()):
+            if self.mirror.get(path) == value:
+                self.stats.record('write_to_echo', now - written)
+                del self.pending_echoes[path]
+                
+    def on_phase_start(self, status, phase, now):
+        if status == GameState.GAME_OVER:
+            if self.game_started is not None:
+                self.stats.record('game_duration', now - self.game_started)
+            self.finished.set()
+            return
+            
+        if status in (GameState.NIGHT, GameState.DAY_VOTING):
+            self.phase_started = now
+            self.last_action = None
+            self.seen_actions = set()
+            if self.player is not None:
+                self.scheduler.call_later(0, self.act, status, phase)
+                
+    def note_actions(self, game, status, phase, now):
+        """Record the arrival of the current phase's new actions"""
+        actions = PhaseResolver._child(game, self.rules.action_path(status, phase))
+        for source_id, action in actions.items():
+            if source_id in self.seen_actions:
+                continue
+            self.seen_actions.add(source_id)
+            self.last_action = now
+            if isinstance(action, dict) and isinstance(action.get('timestamp'), (int, float)):
+                self.stats.record('action_to_echo', now - action['timestamp'] / 1000.0)
+                
+    def step(self, game, status, phase):
+        """Advance the game if the current phase is over (at most once per phase)"""
+        key = (status, phase)
+        if key == self.done_key:
+            return
+            
+        if status == GameState.LOBBY:
+            if len(game.get('players', {})) >= self.total_players:
+                self.advance(key, self.start_game)
+        elif status in (GameState.NIGHT, GameState.DAY_VOTING):
+            if self.rules.ready(game):
+                self.stats.record('phase_start_to_last_action', (self.last_action or self.phase_started) - self.phase_started)
+                if self.resolve_on_server:
+                    self.done_key = key
+                elif status == GameState.NIGHT:
+                    self.advance(key, self.process_night_actions, phase)
+                else:
+                    self.advance(key, self.process_voting_results, phase)
+        elif status == GameState.NIGHT_RESULTS:
+            self.advance(key, self.write, {'status': GameState.DAY_DISCUSSION})
+        elif status == GameState.DAY_DISCUSSION:
+            self.advance(key, self.write, {'status': GameState.DAY_VOTING})
+            
+    def advance(self, key, callback, *args):
+        self.done_key = key
+        self.scheduler.call_later(self.pause, self.run, callback, *args)
+        
+    def run(self, callback, *args):
+        try:
+            callback(*args)
+        except Exception as e:
+            print(f"Load test game {self.game_id}: Error in host step {callback.__name__}: {e}")
+            metrics.inc('errors_total', where='loadgen_host')
+            
+    def write(self, updates):
+        """One update of the game, timing each path until its echo"""
+        with self.lock:
+            now = clock.time()
+            for path, value in updates.items():
+                if self.mirror.get(path) != value:
+                    self.pending_echoes[path] = (value, now)
+        self.game_ref.update(updates)
+        
+    def write_chain(self, updates):
+        """Write a phase outcome one path at a time like the app, status last"""
+        final = {key: updates.pop(key) for key in ('status', 'currentPhase') if key in updates}
+        for path, value in updates.items():
+            self.write({path: value})
+        self.write(final)
+        
+    def start_game(self):
+        """Assign roles and start the first night, as GameController.startGame"""
+        players = self.mirror.get('players', {})
+        roles = assign_roles(list(players))
+        updates = {'status': GameState.NIGHT, 'currentPhase': 1}
+        for player_id, role in roles.items():
+            updates[f'players/{player_id}/role'] = role
+            updates[f'players/{player_id}/isAlive'] = True
+            
+        self.player = VirtualPlayer(self.game_id, self.host_id, 'Host', roles.get(self.host_id))
+        self.game_started = clock.time()
+        self.write(updates)
+        
+    def act(self, status, phase):
+        """Have the host play its own night action or vote"""
+        players = self.mirror.get('players', {})
+        self.player.update_status(players.get(self.host_id, {}))
+        if status == GameState.NIGHT:
+            self.player.perform_night_action(phase, RosterSnapshot(players))
+        else:
+            self.player.perform_day_vote(phase, RosterSnapshot(players))
+            
+    def process_night_actions(self, phase):
+        """PhaseController.processNightActions: read actions and players, then write the outcome"""
+        actions = self.game_ref.child(f'actions/night/{phase}').get() or {}
+        players = self.game_ref.child('players').get() or {}
+        self.write_chain(self.rules.resolve_night(
+            phase, self.rules.parse_actions(actions), self.rules.parse_players(players)))
+        
+    def process_voting_results(self, phase):
+        """PhaseController.processVotingResults: read votes and players, then write the outcome"""
+        votes = self.game_ref.child(f'actions/day/{phase}').get() or {}
+        players = self.game_ref.child('players').get() or {}
+        self.write_chain(self.rules.resolve_votes(
+            phase, self.rules.parse_actions(votes, typed=False), self.rules.parse_players(players)))
+
+def run_load_generator(count, total_players, game_options, timeout=600.0, keep_games=False, pause=0.0):
+    """Play count synthetic games concurrently, each with a ScriptedHost and bots, and report latencies
+    
+    Args:
+        count: Number of games to create
+        total_players: Players per game, host included
+        game_options: Keyword arguments for process_single_game (the bots' settings)
+        timeout: Seconds to wait for every game to finish
+        keep_games: Leave the games in the database instead of deleting them afterwards
+        pause: Seconds each host waits before each step
+        
+    Returns:
+        LatencyStats of the run
+    """
+    stats = LatencyStats()
+    scheduler = game_options.get('scheduler') or default_scheduler()
+    resolve_on_server = game_options.get('resolver') is not None
+    hosts = []
+    managers = []
+    
+    print(f"🚦 Load test: creating {count} games of {total_players} players")
+    started = time.time()
+    simulated_start = clock.monotonic()
+    try:
+        for _ in range(count):
+            host = ScriptedHost(total_players, stats, scheduler, resolve_on_server, pause)
+            host.create()
+            hosts.append(host)
+            manager = process_single_game(host.game_id, total_players, **game_options)
+            if manager:
+                managers.append(manager)
+                
+        if isinstance(scheduler, SimulatedScheduler):
+            # Play the games out in simulated time
+            scheduler.run(until=clock.monotonic() + timeout,
+                          stop=lambda: all(host.finished.is_set() for host in hosts))
+        else:
+            deadline = started + timeout
+            for host in hosts:
+                host.finished.wait(max(0.0, deadline - time.time()))
+    finally:
+        elapsed = time.time() - started
+        for host in hosts:
+            host.stop()
+        for manager in managers:
+            manager.stop_monitoring(immediate=True)
+        if not keep_games:
+            for host in hosts:
+                reference(f'games/{host.game_id}').delete()
+                
+    finished = sum(1 for host in hosts if host.finished.is_set())
+    simulated = ''
+    if isinstance(scheduler, SimulatedScheduler):
+        simulated = f" ({clock.monotonic() - simulated_start:.1f}s simulated)"
+    print(f"\n🚦 Load test: {finished}/{count} games finished in {elapsed:.1f}s{simulated}")
+    print(stats.report())
+    return stats
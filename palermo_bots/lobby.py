@@ -0,0 +1,241 @@
+"""Bot identities, role assignment and discovery of joinable lobbies"""
+
+import threading
+
+from .constants import GameState, MIN_PLAYERS, ROLE_DISTRIBUTION, Role
+from .clocks import rng
+from .instrumentation import metrics
+from .backends import cached_get, reference
+
+def generate_guest_id():
+    """Generate a random guest ID"""
+    return f"guest_{rng.randint(100000, 999999)}"
+
+def generate_player_name(existing_names=None):
+    """Generate a random name for a virtual player that doesn't exist yet in the game
+    
+    Args:
+        existing_names: Set of names already used in the game
+    """
+    if existing_names is None:
+        existing_names = set()
+        
+    first_names = [
+        "Alex", "Blair", "Casey", "Dana", "Elliot", "Fran", "Glenn", 
+        "Harper", "Indigo", "Jordan", "Kyle", "Logan", "Morgan", 
+        "Nico", "Parker", "Quinn", "Riley", "Sage", "Taylor", "Val",
+        "Avery", "Bailey", "Cameron", "Devin", "Eden", "Finley", "Gray",
+        "Hayden", "Ivy", "Jamie", "Kendall", "Lee", "Madison", "Noah",
+        "Oakley", "Peyton", "Reese", "Skyler", "Tristan", "Winter"
+    ]
+    
+    # Filter out names that are already taken
+    available_names = [name for name in first_names if name not in existing_names]
+    
+    if not available_names:
+        # If all names are taken, add a random number suffix
+        name = rng.choice(first_names)
+        suffix = rng.randint(1, 99)
+        return f"{name}{suffix}"
+    
+    return rng.choice(available_names)
+
+def assign_roles(player_ids):
+    """Assign roles to players like the app's RoleAssignmentManager
+    
+    Args:
+        player_ids: IDs of the players in the game
+        
+    Returns:
+        Dict of player_id -> role
+    """
+    distribution = ROLE_DISTRIBUTION.get(len(player_ids), ROLE_DISTRIBUTION[MIN_PLAYERS])
+    roles = [role for role, count in distribution.items() for _ in range(count)]
+    rng.shuffle(roles)
+    
+    # Players beyond the distribution are Paesani
+    return {
+        player_id: roles[index] if index < len(roles) else Role.PAESANO
+        for index, player_id in enumerate(player_ids)
+    }
+
+class LobbyIndex:
+    """Local index of joinable lobbies, kept current from a single change stream on 'games'
+
+    Looking up available games costs O(open lobbies) and no database call, but
+    the stream itself is not cheap: it starts with the whole games tree (finished
+    games included), which is also how the index is filled, sends it again on
+    every reconnect, and then carries every write to every game. It pays off when
+    the stream is already open anyway (it can share a GameEventDispatcher's) or
+    when scans run much more often than games change; a stream of lobbies only
+    would need the app to maintain a separate lobby node.
+    """
+
+    def __init__(self):
+        self.games_ref = reference('games')
+        self.lobbies = {}  # game_id -> {'virtualPlayersEnabled': bool, 'players': set of player IDs}
+        self.lock = threading.Lock()
+        self.listener = None
+        self.loaded = threading.Event()  # Set once the index holds a full view of the games
+
+    def start(self, dispatcher=None):
+        """Start following changes
+        
+        The first event of the stream is a snapshot of all games, which fills the
+        index, so a dispatcher has to be subscribed to before it starts.
+        
+        Args:
+            dispatcher: Optional GameEventDispatcher whose stream to share instead of
+                        opening a listener of our own (not started yet)
+        """
+        if dispatcher is not None:
+            if dispatcher.listener is not None:
+                raise ValueError('The lobby index must subscribe before the dispatcher starts')
+            dispatcher.subscribe(self.on_event)
+        else:
+            self.listener = self.games_ref.listen(self.on_event)
+
+    def stop(self):
+        """Stop following changes"""
+        if self.listener:
+            self.listener.close()
+            self.listener = None
+
+    def _fetch_lobby(self, game_id):
+        """Read just the fields the index needs for a single game, or None if it isn't a lobby"""
+        game_ref = self.games_ref.child(game_id)
+        if game_ref.child('status').get() != GameState.LOBBY:
+            return None
+
+        return {
+            'status': GameState.LOBBY,
+            'virtualPlayersEnabled': game_ref.child('virtualPlayersEnabled').get(),
+            'players': game_ref.child('players').get(shallow=True) or {}
+        }
+
+    def on_event(self, event):
+        """Apply a put/patch event from the 'games' listener to the index"""
+        try:
+            path = [part for part in event.path.split('/') if part]
+            fetch_game_id = None
+
+            with self.lock:
+                fetch_game_id = self._apply(event.event_type, path, event.data)
+
+            # A game we weren't tracking went back to the lobby: read its small fields
+            if fetch_game_id:
+                game_data = self._fetch_lobby(fetch_game_id)
+                if game_data:
+                    with self.lock:
+                        self._put_game(fetch_game_id, game_data)
+        except Exception as e:
+            print(f"Lobby index: error handling event at {event.path}: {e}")
+            metrics.inc('errors_total', where='lobby_index')
+
+    def _apply(self, event_type, path, data):
+        """Apply an event to the index (lock held)
+
+        Returns the ID of a game that has to be fetched to be indexed, if any.
+        """
+        if event_type == 'patch':
+            # A patch is a set of puts relative to the event path
+            fetch_game_id = None
+            for key, value in (data or {}).items():
+                fetch_game_id = self._apply('put', path + key.split('/'), value) or fetch_game_id
+            return fetch_game_id
+
+        if not path:
+            # Full snapshot of all games (sent when the listener connects)
+            self.lobbies.clear()
+            for game_id, game_data in (data or {}).items():
+                self._put_game(game_id, game_data)
+            self.loaded.set()
+            return None
+
+        game_id = path[0]
+
+        if len(path) == 1:
+            self._put_game(game_id, data)
+            return None
+
+        field = path[1]
+        lobby = self.lobbies.get(game_id)
+
+        if lobby is None:
+            if field == 'status' and len(path) == 2 and data == GameState.LOBBY:
+                return game_id
+            return None
+
+        if field == 'status' and len(path) == 2:
+            if data != GameState.LOBBY:
+                del self.lobbies[game_id]
+        elif field == 'virtualPlayersEnabled' and len(path) == 2:
+            lobby['virtualPlayersEnabled'] = bool(data)
+        elif field == 'players':
+            if len(path) == 2:
+                lobby['players'] = set(data) if isinstance(data, dict) else set()
+            elif len(path) == 3 and data is None:
+                lobby['players'].discard(path[2])
+            elif data is not None:
+                lobby['players'].add(path[2])
+
+        return None
+
+    def _put_game(self, game_id, game_data):
+        """Index a game from its data, dropping it if it is not a lobby (lock held)"""
+        if not isinstance(game_data, dict) or game_data.get('status') != GameState.LOBBY:
+            self.lobbies.pop(game_id, None)
+            return
+
+        players = game_data.get('players')
+        self.lobbies[game_id] = {
+            'virtualPlayersEnabled': bool(game_data.get('virtualPlayersEnabled')),
+            'players': set(players) if isinstance(players, dict) else set()
+        }
+
+    def available_games(self):
+        """Return the indexed lobbies that have virtual players enabled"""
+        with self.lock:
+            return [
+                {'id': game_id, 'players': len(lobby['players'])}
+                for game_id, lobby in self.lobbies.items()
+                if lobby['virtualPlayersEnabled']
+            ]
+
+def find_available_games(lobby_index=None):
+    """Find all available games with virtualPlayersEnabled flag set to true
+
+    Args:
+        lobby_index: Optional LobbyIndex to answer from instead of scanning all games
+    """
+    if lobby_index is not None:
+        return lobby_index.available_games()
+
+    games_ref = reference('games')
+    # Not through the read cache: the tree is large and changes between polls while games are played
+    games = games_ref.get() or {}
+    
+    available_games = []
+    
+    for game_id, game_data in games.items():
+        # Check if the game is in lobby state
+        is_lobby = game_data.get('status') == 'lobby'
+        
+        # Check if virtual players are enabled
+        virtual_enabled = bool(game_data.get('virtualPlayersEnabled'))
+        
+        if is_lobby and virtual_enabled:
+            available_games.append({
+                'id': game_id,
+                'players': len(game_data.get('players', {}))
+            })
+    
+    return available_games
+
+def check_virtual_players_enabled(game_id):
+    """Check if virtual players are enabled for the given game"""
+    game_ref = reference(f'games/{game_id}')
+    flags = cached_get(game_ref.child('virtualPlayersEnabled'))
+    
+    # Convert to boolean and handle None case
+    return bool(flags)
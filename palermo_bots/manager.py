@@ -0,0 +1,763 @@
+"""Per-game managers and the discovery loop that creates them"""
+
+import threading
+
+from .constants import GameState
+from .clocks import clock
+from .instrumentation import metrics
+from .backends import GameEvent, cached_get, reference
+from .lobby import check_virtual_players_enabled, find_available_games, generate_guest_id, generate_player_name
+from .bots import RosterSnapshot, VirtualPlayer
+from .scheduling import PhaseTiming, default_scheduler
+from .mirror import GameMirror
+from .resolution import LiveTally
+
+# OwnershipJournal that GameManagers record their bots in, if any
+ownership_journal = None
+
+def set_ownership_journal(journal):
+    """Record the bots of every GameManager in journal (an OwnershipJournal, or None to stop)"""
+    global ownership_journal
+    ownership_journal = journal
+
+class GameManager:
+    """Class to manage a game and its virtual players"""
+    
+    def __init__(self, game_id, batcher=None, scheduler=None, timing=None, resolver=None, tally_debounce=None):
+        self.game_id = game_id
+        self.game_ref = reference(f'games/{game_id}')
+        self.batcher = batcher  # Optional WriteBatcher shared by this game's writes
+        self.scheduler = scheduler or default_scheduler()
+        self.timing = timing or PhaseTiming()
+        self.pending_actions = []  # ScheduledCalls for the bot actions of the current phase
+        self.pending_lock = threading.Lock()  # Guards pending_actions (scheduler and listener threads)
+        self.coordinator = None  # ShardCoordinator holding this game's lease, in multi-worker mode
+        self.resolver = resolver  # Optional PhaseResolver that resolves nights and votes instead of the host
+        self.resolve_lock = threading.Lock()
+        self.resolved_phase = None  # (state, phase) last resolved by us
+        # Optional LiveTally publishing the running vote count of each day phase
+        self.live_tally = LiveTally(self, tally_debounce) if tally_debounce is not None else None
+        self.virtual_players = {}  # player_id -> VirtualPlayer
+        self.our_virtual_players = set()  # Set of player IDs that THIS SCRIPT created
+        self.game_state = GameState.LOBBY
+        self.current_phase = 0
+        self.listener = None
+        self.flag_listener = None
+        self.dispatcher = None
+        self.mirror = GameMirror()  # Local copy of games/{game_id}, kept current by the listener
+        self.roster = None  # RosterSnapshot for the current phase, built on first use
+        self.roster_version = 0
+        self.active = True
+        
+    def start_monitoring(self, dispatcher=None):
+        """Start monitoring the game for state changes
+        
+        Args:
+            dispatcher: Optional GameEventDispatcher to receive events from instead of
+                        opening listeners for this game
+        """
+        if dispatcher is not None:
+            self.dispatcher = dispatcher
+            dispatcher.register(self)
+            return
+            
+        # Set up listeners
+        self.listener = self.game_ref.listen(self.on_game_change)
+        self.flag_listener = self.game_ref.child('virtualPlayersEnabled').listen(self.on_flag_change)
+        
+    def on_game_change(self, event):
+        """Handle an event from the game listener
+        
+        The event is applied to the local mirror of the game, and state, phase and
+        players are then read from the mirror instead of being fetched again.
+        """
+        if not self.active:
+            return
+            
+        try:
+            self.mirror.apply(event.event_type, event.path, event.data)
+            
+            if not self.mirror.loaded:
+                # Listeners always start with a snapshot, so this only happens if we missed it
+                self.mirror.apply('put', '/', self.game_ref.get())
+                
+            if not self.mirror.exists():
+                # The game was deleted; the flag listener takes care of cleaning up
+                return
+                
+            if self.live_tally is not None:
+                self.live_tally.on_event(event)
+                
+            state = self.mirror.get('status', GameState.LOBBY)
+            phase = self.mirror.get('currentPhase', 0)
+            
+            if GameMirror.touches(event, 'players', fields=('isAlive', 'role')):
+                # Someone died, joined, left or got a role: the shared roster is stale
+                self.invalidate_roster()
+                
+            # Check if state changed
+            if state != self.game_state or phase != self.current_phase:
+                old_state = self.game_state
+                self.game_state = state
+                self.current_phase = phase
+                self.invalidate_roster()
+                print(f"Game {self.game_id}: State changed from {old_state} to {state}, phase {phase}")
+                
+                # Update player roles
+                self.update_players()
+                
+                # Perform actions based on state
+                self.handle_state_change(old_state)
+            elif GameMirror.touches(event, 'players'):
+                # Keep roles and liveness of our players current between state changes
+                self.update_players()
+                
+            if self.resolver is not None and (GameMirror.touches(event, 'actions') or
+                                              GameMirror.touches(event, 'players')):
+                self.check_phase_complete()
+        except Exception as e:
+            print(f"Game {self.game_id}: Error handling game change event: {e}")
+            metrics.inc('errors_total', where='game_change')
+    
+    def on_flag_change(self, event):
+        """Handle an event from the virtualPlayersEnabled listener to detect when virtual players are disabled"""
+        if not self.active:
+            return
+        
+        try:
+            # Handle both dictionary and primitive event data types
+            if isinstance(event.data, dict):
+                virtual_enabled = bool(event.data.get('virtualPlayersEnabled', False))
+            else:
+                # Direct value update
+                virtual_enabled = bool(event.data)
+                
+            if not virtual_enabled:
+                print(f"Game {self.game_id}: Virtual players disabled - removing all virtual players")
+                # Schedule removal on a worker thread to avoid the "cannot join current thread" error
+                self.scheduler.call_later(0.1, self.remove_all_virtual_players)
+                # Mark as inactive, but don't try to close listeners from this callback
+                self.active = False
+                self.cancel_pending_actions()
+                # Schedule the actual listener cleanup on a worker thread
+                self.scheduler.call_later(0.5, self.cleanup_listeners)
+                self.scheduler.call_later(0.5, self.release_lease)
+                self.scheduler.call_later(0.5, self.forget_ownership)
+        except Exception as e:
+            print(f"Game {self.game_id}: Error handling flag change event: {e}")
+            metrics.inc('errors_total', where='flag_change')
+            
+    def on_dispatched_event(self, event):
+        """Handle an event routed by a GameEventDispatcher (path relative to the game)"""
+        self.on_game_change(event)
+        
+        # Feed the flag handler the same way its own listener on virtualPlayersEnabled would
+        if event.path == '/':
+            if event.event_type == 'put':
+                flag = event.data.get('virtualPlayersEnabled') if isinstance(event.data, dict) else None
+                self.on_flag_change(GameEvent('put', '/', flag))
+            elif isinstance(event.data, dict) and 'virtualPlayersEnabled' in event.data:
+                self.on_flag_change(GameEvent('put', '/', event.data['virtualPlayersEnabled']))
+        elif event.path == '/virtualPlayersEnabled':
+            self.on_flag_change(GameEvent('put', '/', event.data))
+    
+    def cleanup_listeners(self):
+        """Clean up listeners safely (called from a separate thread)"""
+        try:
+            if self.dispatcher:
+                self.dispatcher.unregister(self.game_id)
+                self.dispatcher = None
+            if self.listener:
+                self.listener.close()
+                self.listener = None
+            if self.flag_listener:
+                self.flag_listener.close()
+                self.flag_listener = None
+        except Exception as e:
+            print(f"Game {self.game_id}: Error cleaning up listeners: {e}")
+            metrics.inc('errors_total', where='cleanup')
+    
+    def on_lease_lost(self):
+        """Stop driving the game after another worker took over its lease
+        
+        Our bots stay in the game for the new owner to adopt.
+        """
+        self.active = False
+        self.cancel_pending_actions()
+        self.coordinator = None
+        self.scheduler.call_later(0.1, self.cleanup_listeners)
+        self.forget_ownership()
+        
+    def release_lease(self):
+        """Give up this game's lease, in multi-worker mode"""
+        if self.coordinator:
+            self.coordinator.release(self.game_id)
+            self.coordinator = None
+            
+    def forget_ownership(self):
+        """Drop this game from the ownership journal, once our bots are gone or no longer ours to run"""
+        if ownership_journal is not None:
+            ownership_journal.forget_game(self.game_id)
+            
+    def stop_monitoring(self, immediate=False):
+        """Stop monitoring the game
+        
+        Args:
+            immediate: Clean up listeners on the calling thread instead of scheduling it
+                       (must not be used from a listener callback)
+        """
+        self.active = False
+        self.cancel_pending_actions()
+        if immediate:
+            self.cleanup_listeners()
+        else:
+            # Schedule listener cleanup on a worker thread
+            self.scheduler.call_later(0.1, self.cleanup_listeners)
+            
+    def update_players(self):
+        """Update virtual players with current data and identify new virtual players"""
+        if self.mirror.loaded:
+            players_data = self.mirror.get('players', {})
+        else:
+            players_data = cached_get(self.game_ref.child('players')) or {}
+        
+        # Update existing virtual players we're tracking
+        for player_id in list(self.virtual_players.keys()):
+            if player_id in players_data:
+                self.virtual_players[player_id].update_status(players_data[player_id] or {})
+            else:
+                # Player no longer exists in the game
+                del self.virtual_players[player_id]
+                
+        # Find new virtual players that we created but aren't tracking yet
+        for player_id, player_data in players_data.items():
+            # Only consider players with IDs that start with "guest_" as virtual players
+            if (player_id not in self.virtual_players and 
+                player_id.startswith('guest_') and
+                'name' in player_data):
+                
+                # Add new virtual player to our tracking
+                self.virtual_players[player_id] = VirtualPlayer(
+                    self.game_id,
+                    player_id,
+                    player_data.get('name', 'Unknown'),
+                    player_data.get('role'),
+                    self.batcher
+                )
+                print(f"Game {self.game_id}: Now tracking virtual player {player_id} ({player_data.get('name')})")
+
+                
+    def get_roster(self):
+        """Return the roster snapshot for the current phase, building it if needed
+        
+        The snapshot is shared by all our bots and dropped whenever the listener
+        reports a change in liveness, roles or the set of players.
+        """
+        roster = self.roster
+        if roster is None:
+            version = self.roster_version
+            if self.mirror.loaded:
+                roster = RosterSnapshot(self.mirror.get('players', {}))
+            else:
+                roster = RosterSnapshot.fetch(self.game_ref.child('players'))
+            # Don't cache it if it was invalidated while being built
+            if version == self.roster_version:
+                self.roster = roster
+        return roster
+        
+    def invalidate_roster(self):
+        """Drop the shared roster snapshot so the next bot builds a fresh one"""
+        self.roster_version += 1
+        self.roster = None
+        
+    def handle_state_change(self, old_state):
+        """Handle game state changes and perform appropriate actions"""
+        print(f"Game {self.game_id}: Handling state change to {self.game_state}")
+        
+        # Whatever was still pending belongs to a phase that has ended
+        self.cancel_pending_actions()
+        
+        if ownership_journal is not None and self.our_virtual_players and self.game_state != GameState.GAME_OVER:
+            ownership_journal.set_phase(self.game_id, self.game_state, self.current_phase)
+            
+        if self.game_state == GameState.NIGHT:
+            self.perform_night_actions()
+            self.schedule_resolution()
+            
+        elif self.game_state == GameState.DAY_VOTING:
+            self.perform_day_voting()
+            self.schedule_resolution()
+            
+        elif self.game_state == GameState.GAME_OVER:
+            print(f"Game {self.game_id}: Game over!")
+            self.stop_monitoring()
+            self.scheduler.call_later(0, self.release_lease)
+            self.forget_ownership()
+            
+    def perform_night_actions(self):
+        """Have virtual players perform their night actions"""
+        print(f"Game {self.game_id}: Scheduling night actions for phase {self.current_phase}")
+        self.schedule_bot_actions(VirtualPlayer.perform_night_action)
+                
+    def perform_day_voting(self):
+        """Have virtual players cast their votes"""
+        print(f"Game {self.game_id}: Scheduling day voting for phase {self.current_phase}")
+        self.schedule_bot_actions(VirtualPlayer.perform_day_vote)
+        
+    def schedule_bot_actions(self, action):
+        """Schedule every one of our alive bots to perform action once, independently
+        
+        Delays come from self.timing and are capped at its deadline, so every bot
+        acts before the deadline; an action that comes due after the phase has
+        ended is dropped instead of being performed late.
+        
+        Args:
+            action: VirtualPlayer method to call as action(player, phase_number, roster)
+        """
+        state = self.game_state
+        phase = self.current_phase
+        # Bots that already acted in this phase (e.g. before a restart) don't act again
+        acted = self.mirror.get(f"actions/{'night' if state == GameState.NIGHT else 'day'}/{phase}", {})
+        
+        # Only perform actions for virtual players CREATED BY THIS SCRIPT
+        for player_id, player in list(self.virtual_players.items()):
+            if player.is_alive and player_id in self.our_virtual_players and player_id not in acted:
+                delay = self.timing.sample()
+                metrics.observe('bot_action_scheduled_delay_seconds', delay)
+                call = self.scheduler.call_later(delay, self.run_bot_action, player, action, state, phase,
+                                                 clock.monotonic() + delay)
+                with self.pending_lock:
+                    self.pending_actions.append(call)
+                
+    def run_bot_action(self, player, action, state, phase, due=None):
+        """Perform a scheduled bot action if its phase is still running
+        
+        Args:
+            due: clock.monotonic() the action was scheduled for, to measure how late it runs
+        """
+        if due is not None:
+            metrics.observe('bot_action_lateness_seconds', max(0.0, clock.monotonic() - due))
+        if not self.active or self.game_state != state or self.current_phase != phase:
+            metrics.inc('bot_actions_dropped_total')
+            return
+        if player.is_alive:
+            action(player, phase, self.get_roster())
+            
+    def schedule_resolution(self):
+        """With a resolver, resolve the phase once everyone has acted or its timeout is up"""
+        if self.resolver is None:
+            return
+        if self.resolver.timeout is not None:
+            call = self.scheduler.call_later(self.resolver.timeout, self.resolve_phase, self.game_state, self.current_phase)
+            with self.pending_lock:
+                self.pending_actions.append(call)
+        self.check_phase_complete()
+        
+    def check_phase_complete(self):
+        """Schedule the resolution of the current phase if every expected player has acted"""
+        if self.game_state not in (GameState.NIGHT, GameState.DAY_VOTING):
+            return
+        if self.resolved_phase == (self.game_state, self.current_phase):
+            return
+        if self.resolver.ready(self.mirror.get('/', {})):
+            # Write from a worker thread, not the listener's
+            self.scheduler.call_later(0, self.resolve_phase, self.game_state, self.current_phase)
+            
+    def resolve_phase(self, state, phase):
+        """Resolve a night or voting phase and commit its outcome in one multi-path update
+        
+        Does nothing if the game has moved on from the phase (e.g. the host resolved
+        it) or the phase was already resolved.
+        """
+        with self.resolve_lock:
+            if not self.active or self.resolved_phase == (state, phase):
+                return
+            game = self.mirror.get('/', {})
+            if game.get('status') != state or game.get('currentPhase', 0) != phase:
+                return
+                
+            updates = self.resolver.resolve(game)
+            if not updates:
+                return
+                
+            try:
+                self.game_ref.update(updates)
+                self.resolved_phase = (state, phase)
+                print(f"Game {self.game_id}: Resolved {state} phase {phase}, status now {updates['status']}")
+            except Exception as e:
+                print(f"Game {self.game_id}: Error resolving {state} phase {phase}: {e}")
+                metrics.inc('errors_total', where='resolver')
+                
+    def cancel_pending_actions(self):
+        """Cancel the bot actions that haven't run yet"""
+        with self.pending_lock:
+            pending, self.pending_actions = self.pending_actions, []
+        for call in pending:
+            call.cancel()
+                
+    def add_virtual_player(self, player_id, player_name, created_by_us=False):
+        """Add a new virtual player to the game
+        
+        Args:
+            player_id: The player ID
+            player_name: The player name
+            created_by_us: Whether this player was created by this script instance
+        """
+        virtual_player = VirtualPlayer(self.game_id, player_id, player_name, batcher=self.batcher)
+        self.virtual_players[player_id] = virtual_player
+        
+        # If we created this player, track it in our set
+        if created_by_us:
+            self.our_virtual_players.add(player_id)
+            print(f"Game {self.game_id}: Tracking player {player_id} as created by this script")
+            if ownership_journal is not None:
+                ownership_journal.add_bot(self.game_id, player_id, player_name)
+            
+        return virtual_player
+        
+    def adopt_virtual_players(self, players_data):
+        """Take over the virtual players already in the game (from a worker whose lease expired)
+        
+        Only players marked isBot are adopted: humans get guest_ IDs from the app too.
+        """
+        for player_id, player_data in players_data.items():
+            if (isinstance(player_data, dict) and player_data.get('isBot') and 'name' in player_data and
+                player_id not in self.our_virtual_players):
+                self.add_virtual_player(player_id, player_data['name'], created_by_us=True)
+                
+    def forget_removed_player(self, player_id):
+        """Stop tracking a virtual player that has been removed from the game"""
+        print(f"Game {self.game_id}: Removed virtual player {player_id}")
+        
+        # Remove from our local tracking
+        self.our_virtual_players.discard(player_id)
+        if player_id in self.virtual_players:
+            del self.virtual_players[player_id]
+        if ownership_journal is not None:
+            ownership_journal.remove_bot(self.game_id, player_id)
+            
+    def remove_all_virtual_players(self):
+        """Remove all virtual players from the game"""
+        if not self.our_virtual_players:
+            return
+            
+        print(f"Game {self.game_id}: Removing {len(self.our_virtual_players)} virtual players created by this script...")
+        
+        # First get current host ID to avoid removing host
+        host_id = self.game_ref.child('hostId').get()
+        
+        # For each virtual player that WE created, remove it
+        removals = {}  # player_id -> Future, when batching
+        for player_id in list(self.our_virtual_players):
+            # Skip if this virtual player is somehow the host
+            if player_id == host_id:
+                print(f"Game {self.game_id}: Virtual player {player_id} is the host - cannot remove")
+                continue
+                
+            if self.batcher is not None:
+                removals[player_id] = self.batcher.write(self.game_id, f'players/{player_id}', None)
+                continue
+                
+            try:
+                # Remove the player from Firebase - using the correct path
+                reference(f'games/{self.game_id}/players/{player_id}').delete()
+                self.forget_removed_player(player_id)
+            except Exception as e:
+                print(f"Game {self.game_id}: Error removing player {player_id}: {e}")
+                metrics.inc('errors_total', where='remove_player')
+                
+        if removals:
+            # All removals go out as one multi-path update
+            self.batcher.flush(self.game_id, wait_for_result=True)
+            for player_id, future in removals.items():
+                if future.exception():
+                    print(f"Game {self.game_id}: Error removing player {player_id}: {future.exception()}")
+                    metrics.inc('errors_total', where='remove_player')
+                else:
+                    self.forget_removed_player(player_id)
+        
+        print(f"Game {self.game_id}: All virtual players created by this script have been removed")
+
+class GameRegistry:
+    """The GameManagers of the monitor, keyed by game ID
+    
+    Discovery goes through the registry so that finding the same lobby again
+    reuses its manager (and its listeners) instead of creating a new one.
+    """
+    
+    def __init__(self):
+        self.managers = {}  # game_id -> GameManager
+        self.lock = threading.Lock()
+        
+    def get(self, game_id):
+        """Return the active manager of a game, or None"""
+        with self.lock:
+            manager = self.managers.get(game_id)
+            if manager is not None and not manager.active:
+                del self.managers[game_id]
+                return None
+            return manager
+            
+    def add(self, manager):
+        with self.lock:
+            self.managers[manager.game_id] = manager
+            
+    def prune(self):
+        """Forget managers of games that have finished or disabled virtual players"""
+        with self.lock:
+            for game_id in [gid for gid, manager in self.managers.items() if not manager.active]:
+                del self.managers[game_id]
+                
+    def active_managers(self):
+        with self.lock:
+            return [manager for manager in self.managers.values() if manager.active]
+            
+    def __len__(self):
+        with self.lock:
+            return len(self.managers)
+
+def process_single_game(game_id, total_players, dispatcher=None, batcher=None, scheduler=None, timing=None,
+                        registry=None, coordinator=None, resolver=None, tally_debounce=None):
+    """Process a single game by adding virtual players if needed and monitor gameplay
+    
+    Args:
+        game_id: The game ID
+        total_players: Total number of players desired in the game
+        dispatcher: Optional GameEventDispatcher to monitor the game through
+        batcher: Optional WriteBatcher to merge this game's writes into multi-path updates
+        scheduler: BotScheduler to run the bots' delayed actions on (shared default if None)
+        timing: PhaseTiming for the bots' actions (defaults if None)
+        registry: Optional GameRegistry; a game that already has a manager there only
+                  gets its missing bots topped up, without a new manager or listeners
+        coordinator: Optional ShardCoordinator; a new game is only taken if it hashes to
+                     this worker and its lease can be acquired
+        resolver: Optional PhaseResolver to resolve the game's nights and votes
+        tally_debounce: If set, publish a live vote tally of the game at most this often (seconds)
+    """
+    game_manager = registry.get(game_id) if registry is not None else None
+    
+    previous_owner = None
+    
+    if game_manager is None:
+        # In multi-worker mode, leave games that belong to other workers alone
+        if coordinator is not None and not coordinator.owns(game_id):
+            return False
+            
+        # First check if virtual players are enabled
+        if not check_virtual_players_enabled(game_id):
+            print(f"Game {game_id}: Virtual players are not enabled. Skipping.")
+            return False
+            
+        if coordinator is not None:
+            acquired, previous_owner = coordinator.acquire(game_id)
+            if not acquired:
+                return False
+    elif game_manager.game_state != GameState.LOBBY:
+        # Too late to add players, the existing manager is already playing
+        return game_manager
+    
+    game_ref = reference(f'games/{game_id}')
+    players_ref = game_ref.child('players')
+
+    if game_manager is not None and game_manager.mirror.loaded:
+        existing_players = game_manager.mirror.get('players', {})
+    else:
+        existing_players = players_ref.get() or {}
+        
+    # Bots we just added may not have reached the mirror yet
+    existing_ids = set(existing_players)
+    if game_manager is not None:
+        existing_ids |= game_manager.our_virtual_players
+    
+    # Count real players and track names for uniqueness
+    real_player_count = len(existing_ids)
+    existing_names = set()
+    
+    for player_data in existing_players.values():
+        if 'name' in player_data:
+            existing_names.add(player_data['name'])
+    if game_manager is not None:
+        existing_names |= {player.player_name for player in game_manager.virtual_players.values()}
+
+    # Calculate how many virtual players to add
+    total_desired = total_players
+    virtual_players_to_add = max(0, total_desired - real_player_count)
+    
+    if game_manager is not None:
+        # Already monitoring this game: only top up missing bots
+        if virtual_players_to_add > 0:
+            print(f"➕ Game {game_id}: Topping up {virtual_players_to_add} virtual players")
+            add_virtual_players(game_manager, virtual_players_to_add, existing_names)
+        return game_manager
+        
+    print(f"🎮 Game {game_id}: {real_player_count} existing players found")
+    
+    # Create a game manager to monitor and control virtual players
+    game_manager = GameManager(game_id, batcher, scheduler, timing, resolver, tally_debounce)
+    
+    if coordinator is not None:
+        game_manager.coordinator = coordinator
+        coordinator.track(game_id, game_manager)
+        
+    if previous_owner and previous_owner != coordinator.worker_id:
+        # Failover: the bots in the game were created by the previous owner
+        game_manager.adopt_virtual_players(existing_players)
+        if game_ref.child('status').get() != GameState.LOBBY:
+            virtual_players_to_add = 0
+    
+    # Add new virtual players if needed
+    if virtual_players_to_add > 0:
+        print(f"➕ Game {game_id}: Adding {virtual_players_to_add} virtual players")
+        add_virtual_players(game_manager, virtual_players_to_add, existing_names)
+        print(f"Game '{game_id}' now has {real_player_count + virtual_players_to_add} total players")
+    else:
+        print(f"Game {game_id}: No need to add more virtual players, starting to monitor gameplay")
+    
+    # Start monitoring
+    game_manager.start_monitoring(dispatcher)
+    
+    if registry is not None:
+        registry.add(game_manager)
+    
+    return game_manager
+
+def add_virtual_players(game_manager, count, existing_names):
+    """Create count new virtual players in the manager's game
+    
+    Args:
+        game_manager: GameManager of the game (its batcher is used when it has one)
+        count: Number of virtual players to add
+        existing_names: Set of names already used in the game (updated in place)
+    """
+    game_id = game_manager.game_id
+    batcher = game_manager.batcher
+    players_ref = game_manager.game_ref.child('players')
+    
+    additions = {}  # player_id -> (player_name, Future), when batching
+    for _ in range(count):
+        player_id = generate_guest_id()
+        player_name = generate_player_name(existing_names)
+        # Add the name to our tracking set to prevent duplicates within the same batch
+        existing_names.add(player_name)
+        
+        player_data = {
+            'id': player_id,
+            'name': player_name,
+            'role': None,
+            'isAlive': True,
+            'isBot': True  # Tells our bots apart from humans, whose IDs are guest_ too
+        }
+        
+        if batcher is not None:
+            additions[player_id] = (player_name, batcher.write(game_id, f'players/{player_id}', player_data))
+            continue
+            
+        players_ref.child(player_id).set(player_data)
+        print(f"🤖 Game {game_id}: Added virtual player: {player_id} with name {player_name}")
+        
+        # Add to game manager AND mark as created by us
+        game_manager.add_virtual_player(player_id, player_name, created_by_us=True)
+        
+    if additions:
+        # All the bots join in one multi-path update
+        batcher.flush(game_id, wait_for_result=True)
+        for player_id, (player_name, future) in additions.items():
+            if future.exception():
+                print(f"Game {game_id}: Error adding virtual player {player_id}: {future.exception()}")
+                metrics.inc('errors_total', where='add_player')
+                continue
+            print(f"🤖 Game {game_id}: Added virtual player: {player_id} with name {player_name}")
+            game_manager.add_virtual_player(player_id, player_name, created_by_us=True)
+
+def fill_game_room_with_guests(game_id=None, total_players=4, lobby_index=None, dispatcher=None, batcher=None,
+                               scheduler=None, timing=None, registry=None, coordinator=None, resolver=None,
+                               tally_debounce=None):
+    """Add virtual players to the game if enabled and monitor their gameplay
+    
+    If no game_id is provided, it will find available games automatically
+    (from lobby_index when given, otherwise by scanning all games).
+    Games are monitored through dispatcher and written through batcher when given;
+    scheduler and timing control when the bots act. With a registry, games that
+    already have a manager reuse it and only get missing bots topped up. With a
+    coordinator, only games assigned to this worker are taken, including games
+    of dead workers that fail over to it. With a resolver, nights and votes of the
+    games are resolved here instead of on the host's phone. With tally_debounce,
+    each game gets a live vote tally under liveTally/{phase}.
+    
+    Returns:
+        A list of active game managers
+    """
+    game_managers = []
+    
+    if not game_id:
+        # Find available games
+        available_games = find_available_games(lobby_index)
+        
+        if coordinator is not None:
+            # Games of dead workers that fail over to us, whatever their state
+            known_ids = {game['id'] for game in available_games}
+            available_games += [{'id': orphan_id} for orphan_id in coordinator.orphaned_games() if orphan_id not in known_ids]
+        
+        if not available_games:
+            print("🔍 No available games found with virtualPlayersEnabled flag. Will check again later.")
+            return game_managers  # Return empty list but don't exit
+        
+        # Process all available games
+        for game in available_games:
+            game_id = game['id']
+            print(f"🎮 Processing game: {game_id}")
+            game_manager = process_single_game(game_id, total_players, dispatcher, batcher, scheduler, timing,
+                                               registry, coordinator, resolver, tally_debounce)
+            if game_manager:
+                game_managers.append(game_manager)
+        
+        return game_managers
+    else:
+        # Process just the specified game
+        game_manager = process_single_game(game_id, total_players, dispatcher, batcher, scheduler, timing,
+                                           registry, coordinator, resolver, tally_debounce)
+        if game_manager:
+            game_managers.append(game_manager)
+        return game_managers
+
+def resume_journaled_games(journal, dispatcher=None, batcher=None, scheduler=None, timing=None, registry=None,
+                           coordinator=None, resolver=None, tally_debounce=None):
+    """Take back the games and bots listed in an OwnershipJournal after a restart
+    
+    Each game gets a manager that owns its journaled bots again and starts
+    listening right away, without reading the games first: the listener's initial
+    snapshot brings the manager to the game's current state and phase, so bots
+    that haven't acted yet in that phase do so. Games that were deleted or had
+    virtual players disabled in the meantime are cleaned up by the flag listener.
+    The options are the same as for fill_game_room_with_guests.
+    
+    Returns:
+        A list of the resumed game managers
+    """
+    game_managers = []
+    for game_id, entry in journal.games().items():
+        if registry is not None and registry.get(game_id) is not None:
+            continue
+        if coordinator is not None:
+            # Another worker may have taken the game over while we were down
+            acquired, _ = coordinator.acquire(game_id) if coordinator.owns(game_id) else (False, None)
+            if not acquired:
+                print(f"Game {game_id}: Now owned by another worker, leaving its bots to it")
+                journal.forget_game(game_id)
+                continue
+                
+        print(f"♻️ Game {game_id}: Resuming {len(entry['bots'])} virtual players "
+              f"(last seen in {entry['state']}, phase {entry['phase']})")
+        game_manager = GameManager(game_id, batcher, scheduler, timing, resolver, tally_debounce)
+        if coordinator is not None:
+            game_manager.coordinator = coordinator
+            coordinator.track(game_id, game_manager)
+        for player_id, name in entry['bots'].items():
+            game_manager.add_virtual_player(player_id, name, created_by_us=True)
+            
+        game_manager.start_monitoring(dispatcher)
+        if registry is not None:
+            registry.add(game_manager)
+        game_managers.append(game_manager)
+        
+    return game_managers
@@ -0,0 +1,204 @@
+"""Local mirrors of games kept current from listener events"""
+
+import threading
+import copy
+
+from .instrumentation import metrics
+from .backends import GameEvent, reference
+
+class GameMirror:
+    """In-memory copy of a game tree, kept current by applying listener put/patch events"""
+    
+    def __init__(self):
+        self.data = None
+        self.loaded = False  # Whether a full snapshot of the game has been applied
+        self.lock = threading.Lock()
+        
+    @staticmethod
+    def split_path(path):
+        return [part for part in path.split('/') if part]
+        
+    @staticmethod
+    def touches(event, key, fields=None):
+        """Whether an event (path relative to the game) may change the given top-level key
+        
+        Args:
+            event: The event
+            key: Top-level key of the game, e.g. 'players'
+            fields: If given, only count changes to these fields of the key's children
+                    (e.g. ('isAlive', 'role') of each player) or to whole children
+        """
+        base = GameMirror.split_path(event.path)
+        if event.event_type == 'patch' and isinstance(event.data, dict):
+            paths = [base + GameMirror.split_path(k) for k in event.data]
+        else:
+            paths = [base]
+            
+        for path in paths:
+            if not path:
+                return True
+            if path[0] != key:
+                continue
+            if fields is None or len(path) <= 2 or path[2] in fields:
+                return True
+        return False
+        
+    def apply(self, event_type, path, data):
+        """Apply a put (replace the value at path) or patch (put each child key) event"""
+        parts = self.split_path(path)
+        with self.lock:
+            if event_type == 'patch':
+                for key, value in (data or {}).items():
+                    self._put(parts + self.split_path(key), value)
+            else:
+                self._put(parts, data)
+                if not parts:
+                    self.loaded = True
+                    
+    def _put(self, parts, value):
+        value = copy.deepcopy(value)
+        if not parts:
+            self.data = value
+            return
+            
+        if not isinstance(self.data, dict):
+            if value is None:
+                return
+            self.data = {}
+            
+        node = self.data
+        parents = []
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                if value is None:
+                    return
+                child = node[part] = {}
+            parents.append((node, part))
+            node = child
+            
+        if value is None:
+            node.pop(parts[-1], None)
+            # Drop nodes left empty, like the database does
+            while not node and parents:
+                parent, key = parents.pop()
+                del parent[key]
+                node = parent
+        else:
+            node[parts[-1]] = value
+            
+    def exists(self):
+        """Whether the mirrored game has any data"""
+        with self.lock:
+            return bool(self.data)
+            
+    def get(self, path='/', default=None):
+        """Return a copy of the value at path, or default if there is none"""
+        with self.lock:
+            node = self.data
+            for part in self.split_path(path):
+                if not isinstance(node, dict):
+                    return default
+                node = node.get(part)
+            return copy.deepcopy(node) if node is not None else default
+
+class GameEventDispatcher:
+    """Routes the events of one listener on 'games' to the GameManagers of the monitored games
+    
+    A single HTTP stream and thread serve every game, so connection and thread count
+    stay constant no matter how many games are being monitored.
+    """
+    
+    def __init__(self):
+        self.games_ref = reference('games')
+        self.managers = {}  # game_id -> GameManager
+        self.subscribers = []  # Callbacks that receive every raw event (e.g. LobbyIndex.on_event)
+        self.lock = threading.Lock()
+        self.delivered = {}  # game_id -> events delivered to its manager since it registered
+        self.delivery_lock = threading.Lock()  # Serializes deliveries, so a snapshot can't land after a newer event
+        self.listener = None
+        
+    def start(self):
+        """Open the shared listener"""
+        self.listener = self.games_ref.listen(self.on_event)
+        
+    def stop(self):
+        """Close the shared listener"""
+        if self.listener:
+            self.listener.close()
+            self.listener = None
+            
+    def subscribe(self, callback):
+        """Receive every event of the shared listener, unrouted"""
+        self.subscribers.append(callback)
+        
+    def register(self, manager):
+        """Start routing events for the manager's game to it
+        
+        The manager first gets the current game as a put at '/', just like
+        the initial event of a listener opened on the game itself. The game is
+        read on the caller's thread, so if an event for it is delivered in the
+        meantime the read may be older than that event and is dropped; the
+        manager then loads the game itself after the event.
+        """
+        with self.delivery_lock:
+            self.delivered[manager.game_id] = 0
+        with self.lock:
+            self.managers[manager.game_id] = manager
+            
+        game_data = self.games_ref.child(manager.game_id).get()
+        self._deliver(manager, GameEvent('put', '/', game_data), snapshot=True)
+        
+    def unregister(self, game_id):
+        """Stop routing events for a game"""
+        with self.lock:
+            self.managers.pop(game_id, None)
+        with self.delivery_lock:
+            self.delivered.pop(game_id, None)
+            
+    def on_event(self, event):
+        """Route an event from the shared listener by the game ID at the start of its path"""
+        for callback in self.subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Dispatcher: error in subscriber for event at {event.path}: {e}")
+                metrics.inc('errors_total', where='dispatcher')
+                
+        path = [part for part in event.path.split('/') if part]
+        
+        with self.lock:
+            managers = dict(self.managers)
+            
+        if not managers:
+            return
+            
+        if path:
+            manager = managers.get(path[0])
+            if manager:
+                self._deliver(manager, GameEvent(event.event_type, '/' + '/'.join(path[1:]), event.data))
+        elif event.event_type == 'put':
+            # Snapshot of every game: give each manager its own game
+            games = event.data if isinstance(event.data, dict) else {}
+            for game_id, manager in managers.items():
+                self._deliver(manager, GameEvent('put', '/', games.get(game_id)))
+        else:
+            # Patch at the root: each key is a put relative to 'games'
+            for key, value in (event.data or {}).items():
+                key_path = [part for part in key.split('/') if part]
+                manager = managers.get(key_path[0]) if key_path else None
+                if manager:
+                    self._deliver(manager, GameEvent('put', '/' + '/'.join(key_path[1:]), value))
+                    
+    def _deliver(self, manager, event, snapshot=False):
+        with self.delivery_lock:
+            if snapshot and self.delivered.get(manager.game_id):
+                metrics.inc('dispatcher_snapshots_dropped_total')
+                return
+            if not snapshot:
+                self.delivered[manager.game_id] = self.delivered.get(manager.game_id, 0) + 1
+            try:
+                manager.on_dispatched_event(event)
+            except Exception as e:
+                print(f"Game {manager.game_id}: Error handling dispatched event at {event.path}: {e}")
+                metrics.inc('errors_total', where='dispatcher')
@@ -0,0 +1,259 @@
+"""Recording database traffic to a file and replaying it locally"""
+
+import time
+import threading
+import collections
+
+from .clocks import clock
+from .backends import DatabaseBackend, _split_path, reference
+from .manager import GameManager
+
+class SessionRecorder:
+    """Append-only msgpack log of database writes and listener events
+    
+    One file holds one session: an existing file at path is replaced, since the
+    timestamps of two sessions can't be replayed as one stream.
+    
+    Each record is an array starting with its kind and clock.monotonic():
+        ['header', t, version, wall time]
+        ['event', t, listen path, event type, event path, data]
+        ['set', t, path, value]        (also push and transaction results)
+        ['update', t, path, updates]
+        ['delete', t, path]
+    """
+    
+    VERSION = 1
+    
+    def __init__(self, path, flush_every=100):
+        import msgpack
+        
+        self.file = open(path, 'wb')
+        self.packer = msgpack.Packer(use_bin_type=True)
+        self.flush_every = flush_every
+        self.unflushed = 0
+        self.lock = threading.Lock()
+        self.record('header', self.VERSION, time.time())
+        
+    def record(self, kind, *fields):
+        data = self.packer.pack([kind, clock.monotonic()] + list(fields))
+        with self.lock:
+            self.file.write(data)
+            self.unflushed += 1
+            if self.unflushed >= self.flush_every:
+                self.file.flush()
+                self.unflushed = 0
+                
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+class RecordingBackend(DatabaseBackend):
+    """Backend wrapper that records every write and listener event to a SessionRecorder"""
+    
+    def __init__(self, backend, recorder):
+        self.backend = backend
+        self.recorder = recorder
+        
+    def reference(self, path='/'):
+        return RecordingReference(self.backend.reference(path), self.recorder)
+
+class RecordingReference:
+    """Reference wrapper for RecordingBackend (reads and queries pass straight through)"""
+    
+    def __init__(self, ref, recorder):
+        self._ref = ref
+        self._recorder = recorder
+        
+    def __getattr__(self, name):
+        return getattr(self._ref, name)
+        
+    @property
+    def parent(self):
+        parent = self._ref.parent
+        return RecordingReference(parent, self._recorder) if parent is not None else None
+        
+    def child(self, path):
+        return RecordingReference(self._ref.child(path), self._recorder)
+        
+    def set(self, value):
+        self._ref.set(value)
+        self._recorder.record('set', self._ref.path, value)
+        
+    def set_if_unchanged(self, expected_etag, value):
+        result = self._ref.set_if_unchanged(expected_etag, value)
+        if result[0]:
+            self._recorder.record('set', self._ref.path, value)
+        return result
+        
+    def update(self, value):
+        self._ref.update(value)
+        self._recorder.record('update', self._ref.path, value)
+        
+    def delete(self):
+        self._ref.delete()
+        self._recorder.record('delete', self._ref.path)
+        
+    def push(self, value=''):
+        child = self._ref.push(value)
+        self._recorder.record('set', child.path, value)
+        return RecordingReference(child, self._recorder)
+        
+    def transaction(self, transaction_update):
+        result = self._ref.transaction(transaction_update)
+        self._recorder.record('set', self._ref.path, result)
+        return result
+        
+    def listen(self, callback):
+        path = self._ref.path
+        
+        def recorded(event):
+            self._recorder.record('event', path, event.event_type, event.path, event.data)
+            callback(event)
+            
+        return self._ref.listen(recorded)
+
+def read_recording(path):
+    """Yield the records of a SessionRecorder file (a truncated last record is ignored)"""
+    import msgpack
+    
+    with open(path, 'rb') as f:
+        unpacker = msgpack.Unpacker(f, raw=False)
+        try:
+            for record in unpacker:
+                yield record
+        except (ValueError, msgpack.OutOfData):
+            return
+
+class SessionReplayer:
+    """Feeds a recording back through a local database
+    
+    The recorded listener events are applied to the database as writes (put as
+    set/delete, patch as update), skipping the parts that are already in place,
+    since the same change usually reached several listeners. Anything listening
+    on the local database, e.g. GameManagers with no bots of their own, then sees
+    the same sequence of changes the recorded process saw. Recorded writes are
+    already in the events they caused, so they are only applied if include_writes.
+    """
+    
+    def __init__(self, path, speed=1.0, include_writes=False):
+        """
+        Args:
+            path: Recording file
+            speed: Playback speed relative to the recorded times (0 for as fast as possible)
+            include_writes: Also apply the recorded writes
+        """
+        self.path = path
+        self.speed = speed
+        self.include_writes = include_writes
+        self.stats = collections.Counter()
+        
+    def game_ids(self):
+        """IDs of the games the recording touches"""
+        found = set()
+        for record in read_recording(self.path):
+            if record[0] == 'event':
+                paths = [self._join(record[2], record[4])]
+                if record[3] == 'patch' and isinstance(record[5], dict):
+                    paths = [self._join(paths[0], key) for key in record[5]]
+                elif paths[0] == '/games' and isinstance(record[5], dict):
+                    found.update(record[5])
+            elif record[0] in ('set', 'update', 'delete'):
+                paths = [record[2]]
+            else:
+                continue
+            for full_path in paths:
+                parts = _split_path(full_path)
+                if len(parts) >= 2 and parts[0] == 'games':
+                    found.add(parts[1])
+        return sorted(found)
+        
+    def run(self):
+        """Play the recording, returns a Counter of what was applied"""
+        started = time.monotonic()
+        first = None
+        
+        for record in read_recording(self.path):
+            kind, recorded_at = record[0], record[1]
+            if first is None:
+                first = recorded_at
+            if self.speed:
+                # Keep the recorded spacing, scaled by speed
+                delay = (recorded_at - first) / self.speed - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+                    
+            self.stats['records'] += 1
+            if kind == 'event':
+                self.apply_event(self._join(record[2], record[4]), record[3], record[5])
+            elif self.include_writes and kind in ('set', 'update', 'delete'):
+                self.apply_write(kind, record[2], *record[3:])
+                
+        self.stats['seconds'] = time.monotonic() - started
+        return self.stats
+        
+    def apply_event(self, path, event_type, data):
+        ref = reference(path)
+        if event_type == 'put':
+            if ref.get() != data:
+                self._put(ref, data)
+                self.stats['puts'] += 1
+            return
+            
+        changed = {key: value for key, value in (data or {}).items() if ref.child(key).get() != value}
+        if changed:
+            ref.update(changed)
+            self.stats['patches'] += 1
+            self.stats['paths'] += len(changed)
+            
+    def apply_write(self, kind, path, value=None):
+        ref = reference(path)
+        if kind == 'set':
+            self._put(ref, value)
+        elif kind == 'update':
+            ref.update(value)
+        else:
+            ref.delete()
+        self.stats['writes'] += 1
+        
+    @staticmethod
+    def _put(ref, value):
+        if value is None:
+            ref.delete()
+        else:
+            ref.set(value)
+            
+    @staticmethod
+    def _join(base, path):
+        return '/' + '/'.join(_split_path(base) + _split_path(path))
+
+def run_replay(path, speed=1.0, include_writes=False, scheduler=None):
+    """Replay a SessionRecorder file into the current (local) database
+    
+    Every game in the recording gets a GameManager without bots that follows it
+    the way the recorded process did, so the replay exercises the same event
+    handling without touching Firebase.
+    
+    Returns:
+        Counter of what the replayer applied
+    """
+    replayer = SessionReplayer(path, speed=speed, include_writes=include_writes)
+    managers = []
+    for game_id in replayer.game_ids():
+        manager = GameManager(game_id, scheduler=scheduler)
+        # No flag listener: the games don't exist yet, which would look like virtual players are disabled
+        manager.listener = manager.game_ref.listen(manager.on_game_change)
+        managers.append(manager)
+        
+    pace = f"{speed:g}x" if speed else "full speed"
+    print(f"⏪ Replaying {path} at {pace} into {len(managers)} games")
+    try:
+        stats = replayer.run()
+    finally:
+        for manager in managers:
+            manager.active = False
+            manager.cleanup_listeners()
+            
+    elapsed = stats['seconds'] or 1e-9
+    print(f"⏪ Replayed {stats['records']} records in {elapsed:.2f}s ({stats['records'] / elapsed:,.0f} records/s): "
+          f"{stats['puts']} puts, {stats['patches']} patches, {stats['writes']} writes")
+    return stats
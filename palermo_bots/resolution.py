@@ -0,0 +1,407 @@
+"""Server-side resolution of nights and votes, and live vote tallies"""
+
+import threading
+import collections
+
+from .constants import ActionType, GameState, NIGHT_ACTIONS, ROLE_DISPLAY_NAMES, Role, Team
+from .instrumentation import metrics
+from .mirror import GameMirror
+
+class PhaseResolver:
+    """Resolves the night actions and day votes of a game in place of the host's phone
+    
+    Same rules and results as the app's PhaseController.processNightActions and
+    processVotingResults, computed from the game's mirror instead of a chain of
+    reads and writes: the phase result, the death and the next status go out as
+    one multi-path update.
+    
+    A phase is resolved as soon as every alive player expected to act has acted,
+    or after timeout seconds with the actions in so far (if a timeout is set).
+    """
+    
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        
+    @staticmethod
+    def key_order(key):
+        """Order child keys like the database: integer keys first, numerically, then strings"""
+        try:
+            return (0, int(key), '')
+        except ValueError:
+            return (1, 0, key)
+            
+    @staticmethod
+    def parse_actions(actions_data, typed=True):
+        """Actions of a phase as (source_id, action) pairs in database order
+        
+        Actions without a target are skipped, and so are actions without a valid
+        type if typed (night actions go through RoleAction.fromMap, votes don't).
+        """
+        action_types = (ActionType.KILL, ActionType.INVESTIGATE, ActionType.PROTECT, ActionType.BLESS, ActionType.VOTE)
+        actions = []
+        for source_id in sorted(actions_data or {}, key=PhaseResolver.key_order):
+            action = actions_data[source_id]
+            if not isinstance(action, dict):
+                continue
+            if typed and action.get('actionType') not in action_types:
+                continue
+            if not isinstance(action.get('targetPlayerId'), str):
+                continue
+            actions.append((source_id, action))
+        return actions
+        
+    @staticmethod
+    def parse_players(players_data):
+        """player_id -> {'name', 'role', 'isAlive'} with the app's defaults"""
+        players = {}
+        for player_id in sorted(players_data or {}, key=PhaseResolver.key_order):
+            data = players_data[player_id] if isinstance(players_data[player_id], dict) else {}
+            players[player_id] = {
+                'name': data.get('name', ''),
+                'role': data.get('role'),
+                'isAlive': data.get('isAlive', True)
+            }
+        return players
+        
+    @staticmethod
+    def winning_team(players, dead=None):
+        """Team that has won, or None, counting dead as no longer alive"""
+        alive = [player for player_id, player in players.items() if player['isAlive'] and player_id != dead]
+        alive_mafia = sum(1 for player in alive if player['role'] == Role.MAFIOSO)
+        alive_citizens = len(alive) - alive_mafia
+        
+        if alive_mafia == 0:
+            return Team.CITIZENS
+        if alive_mafia >= alive_citizens:
+            return Team.MAFIA
+        return None
+        
+    @staticmethod
+    def phase_result(phase_number, state, **fields):
+        """A GameResult.toMap() as stored by the app (null fields left out)"""
+        result = {'phaseNumber': phase_number, 'state': state, 'nightSummary': ''}
+        result.update((key, value) for key, value in fields.items() if value is not None)
+        return result
+        
+    def expected_actors(self, state, players):
+        """IDs of the alive players expected to act in the phase"""
+        return {
+            player_id for player_id, player in players.items()
+            if player['isAlive'] and (state == GameState.DAY_VOTING or player['role'] in NIGHT_ACTIONS)
+        }
+        
+    def action_path(self, state, phase_number):
+        kind = 'night' if state == GameState.NIGHT else 'day'
+        return f'actions/{kind}/{phase_number}'
+        
+    def ready(self, game):
+        """Whether every alive player expected to act in the game's current phase has acted"""
+        state = game.get('status')
+        if state not in (GameState.NIGHT, GameState.DAY_VOTING):
+            return False
+            
+        phase_number = game.get('currentPhase', 0)
+        acted = self._child(game, self.action_path(state, phase_number))
+        expected = self.expected_actors(state, self.parse_players(game.get('players')))
+        return bool(expected) and expected <= set(acted)
+        
+    def resolve(self, game):
+        """Resolve the game's current phase
+        
+        Returns:
+            Multi-path update for the game, or None if it is not in a night or voting phase
+        """
+        state = game.get('status')
+        phase_number = game.get('currentPhase', 0)
+        players = self.parse_players(game.get('players'))
+        actions = self.parse_actions(self._child(game, self.action_path(state, phase_number)),
+                                     typed=state == GameState.NIGHT)
+        
+        if state == GameState.NIGHT:
+            return self.resolve_night(phase_number, actions, players)
+        if state == GameState.DAY_VOTING:
+            return self.resolve_votes(phase_number, actions, players)
+        return None
+        
+    def resolve_night(self, phase_number, actions, players):
+        """Night update, as PhaseController.processNightActionsInOrder + saveNightResults"""
+        updates = {}
+        summary = ["Night Phase Results:\n\n"]
+        eliminated_id = None
+        eliminated = {}
+        investigated_id = None
+        investigation_result = None
+        
+        def name_of(player_id, default):
+            player = players.get(player_id)
+            return player['name'] if player is not None else default
+            
+        # Every protected or blessed player is safe
+        protections = [(source_id, action) for source_id, action in actions
+                       if action['actionType'] in (ActionType.PROTECT, ActionType.BLESS)]
+        protected = list(dict.fromkeys(action['targetPlayerId'] for _, action in protections))
+        protected_id = protected[0] if protected else None
+        
+        if len(protected) == 1:
+            protector_id = protections[0][0]
+            protector_name = name_of(protector_id, "Someone")
+            protected_name = name_of(protected_id, "a player")
+            if players.get(protector_id, {}).get('role') == Role.SGARRISTA:
+                summary.append(f"{protector_name} (Sgarrista) protected {protected_name} during the night.\n")
+            else:
+                summary.append(f"{protector_name} (Il Prete) blessed {protected_name} during the night.\n")
+        elif len(protected) > 1:
+            summary.append(f"{len(protected)} players were protected during the night.\n")
+        if protected:
+            summary.append("\n")
+            
+        # The Mafia kill their most picked target (ties go to the target picked first)
+        kill_counts = collections.Counter(action['targetPlayerId'] for _, action in actions
+                                          if action['actionType'] == ActionType.KILL)
+        if kill_counts:
+            kill_target = max(kill_counts, key=lambda target: kill_counts[target])
+            if kill_target not in protected:
+                eliminated_id = kill_target
+                eliminated = players.get(kill_target, {})
+                eliminated_name = eliminated.get('name')
+                summary.append(f"The Mafia targeted and eliminated {eliminated_name} during the night.\n")
+                if eliminated.get('role') is not None:
+                    role_name = ROLE_DISPLAY_NAMES.get(eliminated['role'], eliminated['role'])
+                    summary.append(f"{eliminated_name} was a {role_name}.\n")
+                updates[f'players/{kill_target}/isAlive'] = False
+            else:
+                summary.append(f"The Mafia targeted {name_of(kill_target, 'Unknown')}, but they were protected and survived the night.\n")
+        else:
+            summary.append("The Mafia did not target anyone during the night.\n")
+        summary.append("\n")
+        
+        # Only the first investigation counts; its result is not made public
+        investigations = [(source_id, action) for source_id, action in actions
+                          if action['actionType'] == ActionType.INVESTIGATE]
+        if investigations:
+            inspector_id, investigation = investigations[0]
+            investigated_id = investigation['targetPlayerId']
+            investigation_result = players.get(investigated_id, {}).get('role') == Role.MAFIOSO
+            summary.append(f"{name_of(inspector_id, 'The Inspector')} (Ispettore) investigated "
+                           f"{name_of(investigated_id, 'a suspect')} during the night.\n")
+            
+        # The app checks the players as they were before the kill
+        winning_team = self.winning_team(players)
+        if winning_team is not None:
+            summary.append("\nGAME OVER!\n")
+            if winning_team == Team.MAFIA:
+                summary.append("The Mafia has taken control of the town!\n")
+            else:
+                summary.append("The Citizens have eliminated all Mafia members and saved the town!\n")
+            updates['status'] = GameState.GAME_OVER
+            updates['winningTeam'] = winning_team
+        else:
+            updates['status'] = GameState.NIGHT_RESULTS
+            
+        updates[f'phaseResults/{phase_number}'] = self.phase_result(
+            phase_number, 'NIGHT_RESULTS',
+            eliminatedPlayerId=eliminated_id,
+            eliminatedPlayerName=eliminated.get('name'),
+            eliminatedPlayerRole=eliminated.get('role'),
+            investigationResult=investigation_result,
+            investigatedPlayerId=investigated_id,
+            protectedPlayerId=protected_id,
+            winningTeam=winning_team,
+            nightSummary=''.join(summary)
+        )
+        return updates
+        
+    def resolve_votes(self, phase_number, actions, players):
+        """Voting update, as VotingController.tallyVotes + PhaseController.processVotingResults"""
+        updates = {}
+        votes = collections.Counter(action['targetPlayerId'] for _, action in actions)
+        
+        # Most votes is executed, nobody on a tie
+        executed_id = None
+        if votes:
+            most = max(votes.values())
+            leaders = [target for target, count in votes.items() if count == most]
+            if len(leaders) == 1:
+                executed_id = leaders[0]
+                
+        fields = {}
+        if executed_id is not None:
+            executed = players.get(executed_id, {})
+            fields = {
+                'eliminatedPlayerId': executed_id,
+                'eliminatedPlayerName': executed.get('name') or '',
+                'eliminatedPlayerRole': executed.get('role') or ''
+            }
+            updates[f'players/{executed_id}/isAlive'] = False
+            
+        winning_team = self.winning_team(players, dead=executed_id)
+        if winning_team is not None:
+            updates['status'] = GameState.GAME_OVER
+            updates['winningTeam'] = winning_team
+        else:
+            updates['status'] = GameState.NIGHT
+            updates['currentPhase'] = phase_number + 1
+            
+        updates[f'phaseResults/{phase_number}'] = self.phase_result(
+            phase_number, 'GAME_OVER' if winning_team else 'EXECUTION_RESULT',
+            winningTeam=winning_team, **fields
+        )
+        return updates
+        
+    @staticmethod
+    def _child(game, path):
+        node = game
+        for part in path.split('/'):
+            if not isinstance(node, dict):
+                return {}
+            node = node.get(part)
+        return node if isinstance(node, dict) else {}
+
+class LiveTally:
+    """Running vote count of a game, published to liveTally/{phase}
+    
+    Counts are updated from the listener events on actions/day (votes added,
+    changed or removed) instead of recounting every vote, and published as a
+    small node {'counts': {target: votes}, 'votes': total, 'leader': target or
+    None on a tie}. Publishing is debounced so a burst of votes costs one write,
+    except that the tally is published at once when every alive player has voted.
+    """
+    
+    def __init__(self, manager, debounce=0.5):
+        """
+        Args:
+            manager: GameManager of the game, whose mirror already has each event applied
+            debounce: Seconds to collect vote changes before publishing
+        """
+        self.manager = manager
+        self.debounce = debounce
+        self.votes = {}  # phase -> {voter_id: target_id}
+        self.counts = {}  # phase -> Counter of target_id
+        self.pending = {}  # phase -> ScheduledCall of the next publish
+        self.lock = threading.Lock()
+        
+    def on_event(self, event):
+        """Update the counts for the votes an event (already applied to the mirror) may have changed"""
+        base = GameMirror.split_path(event.path)
+        if event.event_type == 'patch' and isinstance(event.data, dict):
+            paths = [base + GameMirror.split_path(key) for key in event.data]
+        else:
+            paths = [base]
+            
+        changed = set()
+        for path in paths:
+            if path[:2] != ['actions', 'day'][:len(path)]:
+                continue
+            if len(path) < 3:
+                # All the day actions may have changed
+                changed |= self.reload_all()
+            elif len(path) == 3:
+                changed |= self.reload_phase(path[2])
+            else:
+                changed |= self.update_vote(path[2], path[3])
+                
+        for phase in changed:
+            self.schedule_publish(phase)
+            
+    def reload_all(self):
+        """Recount every phase from the mirror, returns the phases whose counts changed"""
+        phases = set(self.manager.mirror.get('actions/day', {})) | set(self.votes)
+        changed = set()
+        for phase in phases:
+            changed |= self.reload_phase(phase)
+        return changed
+        
+    def reload_phase(self, phase):
+        """Recount one phase from the mirror"""
+        phase_votes = self.manager.mirror.get(f'actions/day/{phase}', {})
+        votes = {
+            voter_id: vote['targetPlayerId'] for voter_id, vote in phase_votes.items()
+            if isinstance(vote, dict) and isinstance(vote.get('targetPlayerId'), str)
+        }
+        with self.lock:
+            if self.votes.get(phase, {}) == votes:
+                return set()
+            self.votes[phase] = votes
+            self.counts[phase] = collections.Counter(votes.values())
+        return {phase}
+        
+    def update_vote(self, phase, voter_id):
+        """Move one voter's vote to whatever target the mirror now has for it"""
+        target_id = self.manager.mirror.get(f'actions/day/{phase}/{voter_id}/targetPlayerId')
+        if not isinstance(target_id, str):
+            target_id = None
+            
+        with self.lock:
+            votes = self.votes.setdefault(phase, {})
+            counts = self.counts.setdefault(phase, collections.Counter())
+            previous = votes.get(voter_id)
+            if previous == target_id:
+                return set()
+                
+            if previous is not None:
+                counts[previous] -= 1
+                if counts[previous] <= 0:
+                    del counts[previous]
+            if target_id is None:
+                del votes[voter_id]
+            else:
+                votes[voter_id] = target_id
+                counts[target_id] += 1
+        return {phase}
+        
+    def schedule_publish(self, phase):
+        """Publish a phase's tally after the debounce delay, or now if every alive player has voted"""
+        if self.everyone_voted(phase):
+            with self.lock:
+                call = self.pending.pop(phase, None)
+            if call:
+                call.cancel()
+            self.manager.scheduler.call_later(0, self.publish, phase)
+            return
+            
+        with self.lock:
+            if phase in self.pending:
+                return
+            self.pending[phase] = self.manager.scheduler.call_later(self.debounce, self.publish, phase)
+            
+    def everyone_voted(self, phase):
+        players = self.manager.mirror.get('players', {})
+        alive = {player_id for player_id, data in players.items()
+                 if isinstance(data, dict) and data.get('isAlive', True)}
+        with self.lock:
+            return bool(alive) and alive <= set(self.votes.get(phase, {}))
+            
+    def tally(self, phase):
+        """The liveTally node of a phase"""
+        with self.lock:
+            counts = dict(self.counts.get(phase, {}))
+        leader = None
+        if counts:
+            most = max(counts.values())
+            leaders = [target_id for target_id, count in counts.items() if count == most]
+            if len(leaders) == 1:
+                leader = leaders[0]
+        return {'counts': counts, 'votes': sum(counts.values()), 'leader': leader}
+        
+    def publish(self, phase):
+        """Write a phase's current tally"""
+        with self.lock:
+            self.pending.pop(phase, None)
+        if not self.manager.active:
+            return
+            
+        path = f'liveTally/{phase}'
+        tally = self.tally(phase)
+        if self.manager.batcher is not None:
+            def on_done(future):
+                if future.exception():
+                    print(f"Game {self.manager.game_id}: Error publishing vote tally for phase {phase}: {future.exception()}")
+                    metrics.inc('errors_total', where='live_tally')
+                    
+            self.manager.batcher.write(self.manager.game_id, path, tally).add_done_callback(on_done)
+        else:
+            try:
+                self.manager.game_ref.child(path).set(tally)
+            except Exception as e:
+                print(f"Game {self.manager.game_id}: Error publishing vote tally for phase {phase}: {e}")
+                metrics.inc('errors_total', where='live_tally')
@@ -0,0 +1,177 @@
+"""Scheduling of the bots' delayed actions, in real or simulated time"""
+
+import threading
+import heapq
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from .clocks import rng
+from .instrumentation import metrics
+
+class PhaseTiming:
+    """When bots act within a night or voting phase
+    
+    Each bot acts on its own, start_delay seconds after the phase starts plus a
+    random delay drawn from the distribution ('uniform' between low and high, or
+    'exponential' starting at low with mean high), but never later than deadline
+    seconds after the phase started.
+    """
+    
+    def __init__(self, start_delay=3.0, low=0.5, high=1.5, distribution='uniform', deadline=30.0):
+        if distribution not in ('uniform', 'exponential'):
+            raise ValueError(f"Unknown delay distribution: {distribution}")
+        self.start_delay = start_delay
+        self.low = low
+        self.high = high
+        self.distribution = distribution
+        self.deadline = deadline
+        
+    def sample(self):
+        """Seconds after the start of the phase at which a bot should act"""
+        if self.distribution == 'exponential':
+            delay = self.low + rng.expovariate(1.0 / max(self.high - self.low, 1e-9))
+        else:
+            delay = rng.uniform(self.low, self.high)
+        return min(self.start_delay + delay, self.deadline)
+
+class ScheduledCall:
+    """Handle to a call scheduled on a BotScheduler"""
+    
+    __slots__ = ('scheduler', 'timer', 'cancelled')
+    
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.timer = None  # asyncio.TimerHandle, set on the loop thread
+        self.cancelled = False
+        
+    def cancel(self):
+        """Cancel the call if it hasn't run yet"""
+        self.cancelled = True
+        self.scheduler.cancel_call(self)
+        
+    def _cancel_timer(self):
+        if self.timer:
+            self.timer.cancel()
+
+class BotScheduler:
+    """Runs delayed work for all games and bots from one asyncio event loop
+    
+    Every pending call is an entry in the loop's timer heap, so thousands of
+    scheduled actions cost no threads. When a call is due it runs on a small
+    shared worker pool, so blocking database calls never hold up the timers.
+    """
+    
+    def __init__(self, max_workers=8):
+        import asyncio
+        
+        self.loop = asyncio.new_event_loop()
+        self.workers = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bot-worker')
+        self.thread = threading.Thread(target=self._run, name='bot-scheduler', daemon=True)
+        self.thread.start()
+        
+    def _run(self):
+        import asyncio
+        
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        
+    def call_later(self, delay, callback, *args):
+        """Run callback(*args) on the worker pool after delay seconds (safe from any thread)
+        
+        Returns:
+            A ScheduledCall that can be cancelled
+        """
+        handle = ScheduledCall(self)
+        
+        def arm():
+            if not handle.cancelled:
+                handle.timer = self.loop.call_later(max(0, delay), self._fire, handle, callback, args)
+                
+        self.loop.call_soon_threadsafe(arm)
+        return handle
+        
+    def cancel_call(self, handle):
+        self.loop.call_soon_threadsafe(handle._cancel_timer)
+        
+    def _fire(self, handle, callback, args):
+        if not handle.cancelled:
+            self.workers.submit(self._run_callback, callback, args)
+            
+    def _run_callback(self, callback, args):
+        try:
+            callback(*args)
+        except Exception as e:
+            print(f"Scheduler: error in {getattr(callback, '__name__', callback)}: {e}")
+            metrics.inc('errors_total', where='scheduler')
+            
+    def stop(self):
+        """Stop the event loop and wait for running work to finish"""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.workers.shutdown(wait=True)
+        self.loop.close()
+
+class SimulatedScheduler:
+    """Drop-in for BotScheduler that runs calls in simulated time on the calling thread
+    
+    Calls wait in a heap ordered by due time, ties in the order they were
+    scheduled. run() takes them out one at a time and moves the VirtualClock
+    straight to each due time, so hours of play take only as long as the calls
+    themselves, and the same seed always gives the same sequence of calls.
+    """
+    
+    def __init__(self, virtual_clock):
+        self.clock = virtual_clock
+        self.calls = []  # heap of (due, sequence, ScheduledCall, callback, args)
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+        
+    def call_later(self, delay, callback, *args):
+        handle = ScheduledCall(self)
+        with self.lock:
+            heapq.heappush(self.calls, (self.clock.monotonic() + max(0, delay), next(self.sequence), handle, callback, args))
+        return handle
+        
+    def cancel_call(self, handle):
+        pass  # Cancelled calls are skipped when they come up
+        
+    def run(self, until=None, stop=None):
+        """Run calls in time order until there are none left
+        
+        Args:
+            until: Simulated time to stop at (the clock is left there)
+            stop: Callable checked before each call; run returns once it is true
+        """
+        while stop is None or not stop():
+            with self.lock:
+                if not self.calls:
+                    return
+                if until is not None and self.calls[0][0] > until:
+                    self.clock.advance_to(until)
+                    return
+                due, _, handle, callback, args = heapq.heappop(self.calls)
+                
+            if handle.cancelled:
+                continue
+            self.clock.advance_to(due)
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Scheduler: error in {getattr(callback, '__name__', callback)}: {e}")
+                metrics.inc('errors_total', where='scheduler')
+                
+    def stop(self):
+        """Drop every pending call"""
+        with self.lock:
+            self.calls = []
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+def default_scheduler():
+    """The BotScheduler shared by GameManagers that aren't given one"""
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = BotScheduler()
+        return _default_scheduler
@@ -0,0 +1,256 @@
+"""Spreading games across several bot workers"""
+
+import threading
+import hashlib
+import bisect
+import socket
+import os
+
+from .clocks import clock
+from .instrumentation import metrics
+from .backends import reference
+
+class HashRing:
+    """Consistent hash ring mapping keys (game IDs) to nodes (worker IDs)
+    
+    Each node is placed on the ring replicas times, so adding or removing a
+    worker only moves the games of that worker.
+    """
+    
+    def __init__(self, nodes=(), replicas=64):
+        self.nodes = set(nodes)
+        self.ring = sorted((self._hash(f"{node}#{i}"), node) for node in self.nodes for i in range(replicas))
+        self.hashes = [h for h, _ in self.ring]
+        
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+        
+    def owner(self, key):
+        """The node responsible for key, or None if the ring is empty"""
+        if not self.ring:
+            return None
+        index = bisect.bisect(self.hashes, self._hash(key)) % len(self.ring)
+        return self.ring[index][1]
+
+class LeaseHeldError(Exception):
+    """Raised inside a lease transaction to abort it when another worker holds the lease"""
+
+class ShardCoordinator:
+    """Spreads games across bot workers with consistent hashing and per-game leases
+    
+    Every worker heartbeats under botWorkers/{worker_id}. Games are assigned by
+    hashing their ID onto a ring of the live workers, and the assigned worker
+    takes a lease at games/{game_id}/botLease in a transaction before adding
+    or driving any bots. The games a worker holds are listed under
+    botWorkerGames/{worker_id}, so when a worker stops heartbeating the others
+    find its games without a scan and take them over once the leases expire.
+    
+    Heartbeats are stamped by the database server, and lease expiry is compared
+    against our clock corrected by its offset to the server's, so workers whose
+    clocks disagree still agree on which leases have expired.
+    """
+    
+    def __init__(self, worker_id=None, lease_ttl=30.0):
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_ttl = lease_ttl
+        self.workers_ref = reference('botWorkers')
+        self.worker_games_ref = reference('botWorkerGames')
+        self.ring = HashRing([self.worker_id])
+        self.dead_workers = []
+        self.leases = {}  # game_id -> GameManager driving the game under our lease
+        self.lock = threading.Lock()  # Guards ring, dead_workers and leases
+        self.clock_offset_ms = 0  # Server time minus our time, measured by each heartbeat
+        self.scheduler = None
+        self.renewal = None
+        self.running = False
+        
+    def start(self, scheduler):
+        """Announce this worker and keep its heartbeat and leases renewed"""
+        self.scheduler = scheduler
+        self.running = True
+        self.heartbeat()
+        self._schedule_renewal()
+        print(f"🧩 Worker {self.worker_id}: sharding across {len(self.ring.nodes)} live workers")
+        
+    def stop(self):
+        """Stop renewing and hand our games over to the other workers right away"""
+        self.running = False
+        if self.renewal:
+            self.renewal.cancel()
+            
+        with self.lock:
+            game_ids = list(self.leases)
+        for game_id in game_ids:
+            self.release(game_id, expire_only=True)
+        try:
+            self.workers_ref.child(self.worker_id).delete()
+        except Exception as e:
+            print(f"Worker {self.worker_id}: Error removing heartbeat: {e}")
+            
+    def _schedule_renewal(self):
+        self.renewal = self.scheduler.call_later(self.lease_ttl / 3, self._renew_all)
+        
+    def _renew_all(self):
+        try:
+            self.heartbeat()
+            with self.lock:
+                leases = list(self.leases.items())
+            for game_id, manager in leases:
+                if not self.renew(game_id):
+                    print(f"Game {game_id}: Lease lost to another worker")
+                    with self.lock:
+                        self.leases.pop(game_id, None)
+                    manager.on_lease_lost()
+        finally:
+            if self.running:
+                self._schedule_renewal()
+                
+    def server_time(self):
+        """Milliseconds since the epoch on the database server's clock (as of our last heartbeat)"""
+        return int(clock.time() * 1000) + self.clock_offset_ms
+        
+    def heartbeat(self):
+        """Refresh our heartbeat and rebuild the ring from the workers that are alive"""
+        sent = clock.time()
+        self.workers_ref.child(self.worker_id).set({'.sv': 'timestamp'})
+        written = clock.time()
+        
+        workers = self.workers_ref.get() or {}
+        stamped = workers.get(self.worker_id)
+        if isinstance(stamped, (int, float)):
+            # The server stamped our heartbeat somewhere between sending it and the reply
+            self.clock_offset_ms = int(stamped - (sent + written) / 2 * 1000)
+        now = self.server_time()
+        holders = self.worker_games_ref.get(shallow=True) or {}
+        ttl_ms = self.lease_ttl * 1000
+        live = {
+            worker_id for worker_id, last_seen in workers.items()
+            if isinstance(last_seen, (int, float)) and now - last_seen <= ttl_ms
+        }
+        live.add(self.worker_id)
+        
+        with self.lock:
+            if live != self.ring.nodes:
+                print(f"🧩 Worker {self.worker_id}: live workers changed to {sorted(live)}")
+                self.ring = HashRing(live)
+            # Workers that stopped cleanly have no heartbeat left but may still hold games
+            self.dead_workers = [worker_id for worker_id in set(workers) | set(holders) if worker_id not in live]
+            
+    def owns(self, game_id):
+        """Whether the game hashes to this worker"""
+        with self.lock:
+            return self.ring.owner(game_id) == self.worker_id
+            
+    def orphaned_games(self):
+        """Games held by workers that stopped heartbeating which now hash to us"""
+        orphaned = []
+        for worker_id in list(self.dead_workers):
+            held = self.worker_games_ref.child(worker_id).get(shallow=True) or {}
+            if not held:
+                # Nothing left to take over: forget the worker
+                self.workers_ref.child(worker_id).delete()
+                continue
+            orphaned.extend(game_id for game_id in held if self.owns(game_id))
+        return orphaned
+        
+    def acquire(self, game_id):
+        """Take the lease of a game if it is free, expired or already ours
+        
+        Returns:
+            (acquired, previous_owner) where previous_owner is the worker whose lease we
+            took over, if any
+        """
+        now = self.server_time()
+        previous = {}
+        
+        def take(current):
+            owner = current.get('owner') if isinstance(current, dict) else None
+            if owner not in (None, self.worker_id) and current.get('expiresAt', 0) > now:
+                raise LeaseHeldError(owner)
+            previous['owner'] = owner
+            return {'owner': self.worker_id, 'expiresAt': now + int(self.lease_ttl * 1000)}
+            
+        try:
+            reference(f'games/{game_id}/botLease').transaction(take)
+        except LeaseHeldError:
+            return False, None
+        except Exception as e:
+            print(f"Game {game_id}: Error acquiring lease: {e}")
+            metrics.inc('errors_total', where='lease')
+            return False, None
+            
+        previous_owner = previous.get('owner')
+        self.worker_games_ref.child(f'{self.worker_id}/{game_id}').set(True)
+        if previous_owner and previous_owner != self.worker_id:
+            print(f"Game {game_id}: Took over lease from worker {previous_owner}")
+            self.worker_games_ref.child(f'{previous_owner}/{game_id}').delete()
+        return True, previous_owner
+        
+    def track(self, game_id, manager):
+        """Keep renewing the lease of a game for its manager"""
+        with self.lock:
+            self.leases[game_id] = manager
+        
+    def renew(self, game_id):
+        """Extend our lease of a game; False if it is no longer ours"""
+        now = self.server_time()
+        
+        def extend(current):
+            if not isinstance(current, dict) or current.get('owner') != self.worker_id:
+                raise LeaseHeldError(current.get('owner') if isinstance(current, dict) else None)
+            return {'owner': self.worker_id, 'expiresAt': now + int(self.lease_ttl * 1000)}
+            
+        try:
+            reference(f'games/{game_id}/botLease').transaction(extend)
+            return True
+        except LeaseHeldError:
+            return False
+        except Exception as e:
+            # Keep the game; the lease is still valid until it expires
+            print(f"Game {game_id}: Error renewing lease: {e}")
+            metrics.inc('errors_total', where='lease')
+            return True
+            
+    def release(self, game_id, expire_only=False):
+        """Give up our lease of a game
+        
+        The lease is expired in a transaction first (a transaction can't delete it:
+        firebase_admin rejects a None result), then deleted if it is still our
+        expired lease.
+        
+        Args:
+            game_id: The game ID
+            expire_only: Keep the game listed under this worker with an expired lease, so
+                         another worker takes it over (and adopts its bots) on its next cycle
+        """
+        with self.lock:
+            self.leases.pop(game_id, None)
+        lease_ref = reference(f'games/{game_id}/botLease')
+        tombstone = {'owner': self.worker_id, 'expiresAt': 0}
+        
+        def expire(current):
+            if not isinstance(current, dict) or current.get('owner') != self.worker_id:
+                raise LeaseHeldError(current.get('owner') if isinstance(current, dict) else None)
+            return tombstone
+            
+        try:
+            lease_ref.transaction(expire)
+            expired = True
+        except LeaseHeldError:
+            # Not ours (any more), but our listing of the game is stale all the same
+            expired = False
+        except Exception as e:
+            print(f"Game {game_id}: Error releasing lease: {e}")
+            metrics.inc('errors_total', where='lease')
+            return
+            
+        if expire_only:
+            return
+        try:
+            self.worker_games_ref.child(f'{self.worker_id}/{game_id}').delete()
+            if expired and lease_ref.get() == tombstone:
+                lease_ref.delete()
+        except Exception as e:
+            print(f"Game {game_id}: Error releasing lease: {e}")
+            metrics.inc('errors_total', where='lease')
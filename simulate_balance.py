@@ -0,0 +1,285 @@
+"""Offline Monte Carlo simulator for Palermo Justice role balance
+
+Plays complete games with every player driven by the same policies as the
+VirtualPlayer bots of palermo_bots, resolving nights and votes the way the
+app does (PhaseController / VotingController):
+
+- Night: every Sgarrista / Il Prete target is protected; the Mafia kill the
+  target most of them picked (ties go to the target picked first); the kill
+  fails if the target is protected. Investigations don't change the outcome.
+  The app checks for game over against the players as they were before the
+  kill, so a night can never end the game (use --fresh-night-check to check
+  after the kill instead).
+- Day: every alive player votes; the player with the most votes is executed,
+  nobody is executed on a tie; then the game is checked for game over.
+
+Many games are advanced at once: the state of a batch is a (games, players)
+array of alive flags, and finished games are dropped from the batch after
+every phase.
+
+Usage:
+    python simulate_balance.py --players 4-12 --games 100000
+    python simulate_balance.py --mix 8:3,3,1,1,0 --mix 8:2,4,1,1,0
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from palermo_bots.constants import (
+    ROLE_DISTRIBUTION, SELF_PROTECT_CHANCE, NIGHT_ACTIONS, Role, ActionType
+)
+
+# Column order of a role mix
+ROLE_ORDER = [Role.MAFIOSO, Role.PAESANO, Role.ISPETTORE, Role.SGARRISTA, Role.IL_PRETE]
+
+# Outcome codes
+CITIZENS_WIN = 0
+MAFIA_WIN = 1
+UNFINISHED = 2
+
+class RoleMix:
+    """Roles of the players of a simulated game
+
+    Players are given their roles in ROLE_ORDER. Since the players of a game
+    are interchangeable, this is the same as shuffling the roles; it only fixes
+    the order the Mafia's kill actions are read in, which decides kill ties.
+    """
+
+    def __init__(self, counts):
+        """
+        Args:
+            counts: role -> number of players with that role
+        """
+        self.counts = {role: counts.get(role, 0) for role in ROLE_ORDER}
+        roles = [role for role in ROLE_ORDER for _ in range(self.counts[role])]
+        self.players = len(roles)
+
+        self.mafia = np.array([role == Role.MAFIOSO for role in roles])
+        # Players whose night action stops a kill
+        self.protectors = np.flatnonzero([
+            NIGHT_ACTIONS.get(role) in (ActionType.PROTECT, ActionType.BLESS) for role in roles
+        ])
+        self.killers = np.flatnonzero([
+            NIGHT_ACTIONS.get(role) == ActionType.KILL for role in roles
+        ])
+
+    @classmethod
+    def parse(cls, text):
+        """Parse 'players:mafiosi,paesani,ispettori,sgarristi,preti'"""
+        total, _, counts = text.partition(':')
+        values = [int(value) for value in counts.split(',')]
+        if len(values) != len(ROLE_ORDER):
+            raise ValueError(f"Role mix needs {len(ROLE_ORDER)} counts: {text}")
+        mix = cls(dict(zip(ROLE_ORDER, values)))
+        if mix.players != int(total):
+            raise ValueError(f"Role mix has {mix.players} players, not {total}: {text}")
+        return mix
+
+    def label(self):
+        return '/'.join(str(self.counts[role]) for role in ROLE_ORDER)
+
+def default_mix(players):
+    """The role mix the app uses for a number of players
+
+    Like RoleAssignmentManager, unknown player counts use the mix for the
+    minimum number of players and any players beyond it are Paesani.
+    """
+    counts = dict(ROLE_DISTRIBUTION.get(players, ROLE_DISTRIBUTION[min(ROLE_DISTRIBUTION)]))
+    counts[Role.PAESANO] += players - sum(counts.values())
+    return RoleMix(counts)
+
+class BatchSimulator:
+    """Plays batches of games with one role mix"""
+
+    def __init__(self, mix, rng, fresh_night_check=False, max_rounds=100):
+        """
+        Args:
+            mix: RoleMix of every game
+            rng: numpy Generator
+            fresh_night_check: Check for game over after the night kill instead of before it
+            max_rounds: Night/day rounds after which a game is given up as unfinished
+        """
+        self.mix = mix
+        self.rng = rng
+        self.fresh_night_check = fresh_night_check
+        self.max_rounds = max_rounds
+        self.player_range = np.arange(mix.players)
+        # not_self[i, j]: player i may pick player j
+        self.not_self = ~np.eye(mix.players, dtype=bool)
+
+    def pick(self, eligible):
+        """Pick a uniformly random eligible target for each actor
+
+        Args:
+            eligible: (games, actors, players) bool array
+
+        Returns:
+            (games, actors) array of player indexes (meaningless where nothing is eligible)
+        """
+        keys = self.rng.random(eligible.shape, dtype=np.float32)
+        keys[~eligible] = -1.0
+        return keys.argmax(axis=2)
+
+    def tally(self, targets, acting):
+        """Count the picks of the acting actors per player
+
+        Returns:
+            (counts, first): (games, players) arrays of the number of picks of
+            each player, and the index of the first actor that picked them
+            (the number of actors if none did)
+        """
+        picks = (targets[:, :, None] == self.player_range) & acting[:, :, None]
+        counts = picks.sum(axis=1)
+        actor_index = np.arange(targets.shape[1])[None, :, None]
+        first = np.where(picks, actor_index, targets.shape[1]).min(axis=1)
+        return counts, first
+
+    def winner(self, alive):
+        """Winning team of each game (same check as the app), UNFINISHED if none"""
+        alive_mafia = (alive & self.mix.mafia).sum(axis=1)
+        alive_citizens = alive.sum(axis=1) - alive_mafia
+        return np.where(
+            alive_mafia == 0, CITIZENS_WIN,
+            np.where(alive_mafia >= alive_citizens, MAFIA_WIN, UNFINISHED)
+        )
+
+    def night(self, alive):
+        """Resolve one night in place, returns the game over check"""
+        games = alive.shape[0]
+        targetable = alive[:, None, :] & self.not_self[None, :, :]
+
+        # Mafiosi kill an alive non-mafia player
+        killers = self.mix.killers
+        killers_alive = alive[:, killers]
+        kill_targets = self.pick(targetable[:, killers, :] & ~self.mix.mafia)
+        counts, first = self.tally(kill_targets, killers_alive)
+        # Most picks, ties to the target picked first
+        kill_target = (counts * (len(killers) + 1) - first).argmax(axis=1)
+        has_kill = killers_alive.any(axis=1)
+
+        # Sgarrista / Il Prete protect themselves or another alive player
+        protectors = self.mix.protectors
+        protected = np.zeros(games, dtype=bool)
+        if len(protectors):
+            protectors_alive = alive[:, protectors] & targetable[:, protectors, :].any(axis=2)
+            protect_targets = self.pick(targetable[:, protectors, :])
+            self_protect = self.rng.random(protect_targets.shape) < SELF_PROTECT_CHANCE
+            protect_targets = np.where(self_protect, protectors, protect_targets)
+            protected = ((protect_targets == kill_target[:, None]) & protectors_alive).any(axis=1)
+
+        before_kill = alive.copy()
+        killed = has_kill & ~protected
+        alive[np.flatnonzero(killed), kill_target[killed]] = False
+        return self.winner(alive if self.fresh_night_check else before_kill)
+
+    def day(self, alive):
+        """Resolve one day vote in place, returns the game over check"""
+        targetable = alive[:, None, :] & self.not_self[None, :, :]
+        # Mafiosi vote for non-mafia players, everyone else for anyone
+        eligible = targetable & ~(self.mix.mafia[:, None] & self.mix.mafia[None, :])
+        voters = alive & eligible.any(axis=2)
+        votes, _ = self.tally(self.pick(eligible), voters)
+
+        most = votes.max(axis=1)
+        executed = (votes == most[:, None]).sum(axis=1) == 1
+        executed &= most > 0
+        alive[np.flatnonzero(executed), votes.argmax(axis=1)[executed]] = False
+        return self.winner(alive)
+
+    def run(self, games):
+        """Play games to the end
+
+        Returns:
+            (outcomes, rounds): arrays with the outcome code and the number of
+            nights played of each game
+        """
+        outcomes = np.full(games, UNFINISHED, dtype=np.int8)
+        rounds = np.zeros(games, dtype=np.int16)
+        alive = np.ones((games, self.mix.players), dtype=bool)
+        index = np.arange(games)  # game of each row of alive
+
+        for round_number in range(1, self.max_rounds + 1):
+            for phase in (self.night, self.day):
+                result = phase(alive)
+                done = result != UNFINISHED
+                if done.any():
+                    outcomes[index[done]] = result[done]
+                    rounds[index[done]] = round_number
+                    alive = alive[~done]
+                    index = index[~done]
+                if not len(index):
+                    return outcomes, rounds
+
+        rounds[index] = self.max_rounds
+        return outcomes, rounds
+
+def simulate(mix, games, rng, batch_size=65536, fresh_night_check=False, max_rounds=100):
+    """Play games with a role mix in batches
+
+    Returns:
+        Dict with the number of games, wins per team, unfinished games and average nights
+    """
+    simulator = BatchSimulator(mix, rng, fresh_night_check=fresh_night_check, max_rounds=max_rounds)
+    totals = np.zeros(3, dtype=np.int64)
+    nights = 0
+    remaining = games
+    while remaining > 0:
+        batch = min(batch_size, remaining)
+        outcomes, rounds = simulator.run(batch)
+        totals += np.bincount(outcomes, minlength=3)
+        nights += int(rounds.sum())
+        remaining -= batch
+
+    return {
+        'games': games,
+        'citizens': int(totals[CITIZENS_WIN]),
+        'mafia': int(totals[MAFIA_WIN]),
+        'unfinished': int(totals[UNFINISHED]),
+        'nights': nights / games if games else 0.0
+    }
+
+def parse_player_counts(text):
+    """Parse '4-12' or '5,7,9'"""
+    counts = []
+    for part in text.split(','):
+        low, _, high = part.partition('-')
+        counts.extend(range(int(low), int(high or low) + 1))
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Simulate games between bots to compare role balance')
+    parser.add_argument('--players', type=str, default='4-12',
+                        help='Player counts to simulate with the app\'s role mix, e.g. 4-12 or 5,7,9')
+    parser.add_argument('--mix', action='append', default=[],
+                        help='Role mix to simulate instead, as players:mafiosi,paesani,ispettori,sgarristi,preti (repeatable)')
+    parser.add_argument('--games', type=int, default=100000, help='Games per role mix')
+    parser.add_argument('--batch-size', type=int, default=65536, help='Games advanced together')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed')
+    parser.add_argument('--max-rounds', type=int, default=100, help='Nights after which a game counts as unfinished')
+    parser.add_argument('--fresh-night-check', action='store_true',
+                        help='Check for game over after the night kill (the app checks before it)')
+    args = parser.parse_args()
+
+    if args.mix:
+        mixes = [RoleMix.parse(text) for text in args.mix]
+    else:
+        mixes = [default_mix(players) for players in parse_player_counts(args.players)]
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'Players':>7}  {'Mix M/P/I/S/Pr':<14}  {'Games':>9}  {'Citizens':>8}  {'Mafia':>8}  {'Unfin.':>6}  {'Nights':>6}")
+
+    started = time.perf_counter()
+    total_games = 0
+    for mix in mixes:
+        stats = simulate(mix, args.games, rng, batch_size=args.batch_size,
+                         fresh_night_check=args.fresh_night_check, max_rounds=args.max_rounds)
+        total_games += stats['games']
+        print(f"{mix.players:>7}  {mix.label():<14}  {stats['games']:>9}  "
+              f"{100.0 * stats['citizens'] / stats['games']:>7.2f}%  "
+              f"{100.0 * stats['mafia'] / stats['games']:>7.2f}%  "
+              f"{stats['unfinished']:>6}  {stats['nights']:>6.2f}")
+
+    elapsed = time.perf_counter() - started
+    print(f"\n{total_games} games in {elapsed:.1f}s ({total_games / elapsed * 60:,.0f} games/min)")